@@ -7,47 +7,103 @@ load_dotenv(dotenv_path)
 
 print("🔑 GOOGLE_APPLICATION_CREDENTIALS =", os.getenv("GOOGLE_APPLICATION_CREDENTIALS"))
 
+import asyncio
+import hashlib
+import json
+import multiprocessing
 import traceback
-from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
 from dotenv import load_dotenv
-import io
 from fastapi import FastAPI, File, UploadFile, Query
-from fastapi.responses import JSONResponse
-from PIL import Image
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 
 # --- Local Imports ---
-from services.vector_db import upsert_vectors, reset_namespace
+from services.vector_db import upsert_vectors, flush_vectors, reset_namespace
 from services.bm25 import bm25
 from services.hybrid_search import hybrid_search
-from services.llm import generate_answer
-from services.cache import get_cached_answer, cache_answer
+from services.llm import generate_answer, agenerate_answer, astream_answer, FailedAnswer
+from services.cache import get_cached_answer, cache_answer, get_cached_ocr_result, cache_ocr_result
+from services.embeddings import embed_query
+from services.semcache import answer_cache, search_cache
 from services.ocr import multi_stage_ocr, extract_text_from_image
-from services.filestore import save_upload
+from services.filestore import save_upload, file_sha256
+from services.timeutils import now_iso
+from services import metrics
 from services.memory import add_to_memory, get_memory, clear_memory  # ✅ Conversational memory
 
 load_dotenv()
 
+# ✅ OCR worker pool for batch uploads (OCR is CPU-bound, so use processes).
+# "spawn" keeps workers clear of the parent's gRPC / torch state, which is not fork-safe.
+OCR_CONCURRENCY = int(os.getenv("OCR_CONCURRENCY", os.cpu_count() or 1))
+_ocr_pool = ProcessPoolExecutor(
+    max_workers=OCR_CONCURRENCY,
+    mp_context=multiprocessing.get_context("spawn"),
+)
+
 # ✅ Initialize FastAPI app
 app = FastAPI(title="AstraMind Hybrid RAG System", version="3.0.0")
 
 
+@app.on_event("shutdown")
+def _shutdown_ocr_pool():
+    _ocr_pool.shutdown(wait=False, cancel_futures=True)
+
+
 @app.get("/")
 async def root():
     return {"message": "✅ AstraMind RAG System running with Vision OCR, Hybrid Search & Chat Memory"}
 
 
+@app.get("/metrics")
+def prometheus_metrics():
+    return Response(metrics.render_latest(), media_type=metrics.CONTENT_TYPE_LATEST)
+
+
 # -------------------------------------------------------------
 # ✅ Shared Processing Function for One File
 # -------------------------------------------------------------
-def process_uploaded_file(path: str, file_type: str, filename: str):
+def clear_result_caches():
+    """Drop cached answers and search results once the indexed corpus changes."""
+    answer_cache.clear()
+    search_cache.clear()
+
+
+def reset_indexes():
+    """Wipe Pinecone, BM25 and the result caches before indexing a new upload."""
+    reset_namespace()
+    bm25.reset()
+    clear_result_caches()
+
+
+def process_uploaded_file(path: str, file_type: str, filename: str, reset: bool = True):
     """
     Process one file (PDF, DOCX, or IMAGE) using unified multi-stage OCR,
     then index content in BM25 + Pinecone.
     """
-    reset_namespace()
-    bm25.reset()
+    digest = file_sha256(path)
+    ocr_result = get_cached_ocr_result(digest, file_type)
+    if ocr_result is None:
+        ocr_result = multi_stage_ocr(path, file_type=file_type)
+        if not ocr_result.get("error"):
+            cache_ocr_result(digest, file_type, ocr_result)
+    return index_ocr_result(ocr_result, file_type, filename, reset=reset)
+
+
+def index_ocr_result(
+    ocr_result: dict, file_type: str, filename: str, reset: bool = True, pending: list = None
+):
+    """
+    Index an already-computed OCR result in BM25 + Pinecone.
+    Runs in the API process, since the indexes live here.
+    With reset=False the chunks are appended to what is already indexed;
+    with `pending`, Pinecone vectors are queued for a later flush_vectors().
+    """
+    if reset:
+        reset_indexes()
+    else:
+        clear_result_caches()
 
-    ocr_result = multi_stage_ocr(path, file_type=file_type)
     text = ocr_result.get("text", "").strip()
     tables = ocr_result.get("tables", [])
     engine = ocr_result.get("engine", "Hybrid OCR")
@@ -77,7 +133,8 @@ def process_uploaded_file(path: str, file_type: str, filename: str):
         chunks=all_chunks,
         namespace="default",
         source=filename,
-        meta_extra={"type": file_type, "engine": engine, "page": None}
+        meta_extra={"type": file_type, "engine": engine, "page": None},
+        pending=pending,
     )
 
     return {
@@ -123,19 +180,28 @@ async def upload_image(file: UploadFile = File(...)):
     then index chunks into Pinecone + BM25.
     """
     try:
-        image_bytes = await file.read()
-        image = Image.open(io.BytesIO(image_bytes))
+        path = save_upload(file)
 
-        # ✅ Unified Vision OCR pipeline
-        text_extracted, engine_used = extract_text_from_image(image)
+        # ✅ Unified Vision OCR pipeline (off the event loop), skipped for
+        # an image whose content was OCR'd before
+        digest = await asyncio.to_thread(file_sha256, path)
+        cached = get_cached_ocr_result(digest, "image")
+        if cached:
+            text_extracted, engine_used = cached["text"], cached["engine"]
+        else:
+            loop = asyncio.get_running_loop()
+            text_extracted, engine_used = await loop.run_in_executor(
+                _ocr_pool, extract_text_from_image, path
+            )
+            if text_extracted.strip():
+                cache_ocr_result(digest, "image", {"text": text_extracted, "engine": engine_used})
 
         if not text_extracted.strip():
             return {"error": "No readable text found in image"}
 
         chunks = [chunk.strip() for chunk in text_extracted.split("\n") if chunk.strip()]
 
-        reset_namespace()
-        bm25.reset()
+        reset_indexes()
         bm25.add_documents(chunks)
         upsert_vectors(
             chunks=chunks,
@@ -148,7 +214,7 @@ async def upload_image(file: UploadFile = File(...)):
             "message": "✅ Image processed via Vision-based OCR pipeline",
             "engine_used": engine_used,
             "chunks_indexed": len(chunks),
-            "timestamp": datetime.now().isoformat()
+            "timestamp": now_iso()
         }
 
     except Exception as e:
@@ -168,6 +234,22 @@ async def batch_upload(files: list[UploadFile] = File(...)):
     total_chunks = 0
     total_tables = 0
 
+    loop = asyncio.get_running_loop()
+    sem = asyncio.Semaphore(OCR_CONCURRENCY)
+
+    async def _ocr(path: str, ext: str):
+        digest = await asyncio.to_thread(file_sha256, path)
+        cached = get_cached_ocr_result(digest, ext)
+        if cached is not None:
+            return cached
+        async with sem:
+            result = await loop.run_in_executor(_ocr_pool, multi_stage_ocr, path, ext)
+        if not result.get("error"):
+            cache_ocr_result(digest, ext, result)
+        return result
+
+    # Save every supported file first, then OCR them concurrently
+    jobs = []
     for file in files:
         try:
             filename = file.filename
@@ -176,15 +258,35 @@ async def batch_upload(files: list[UploadFile] = File(...)):
                 all_results.append({"filename": filename, "error": "❌ Unsupported file type"})
                 continue
 
-            path = save_upload(file)
-            result = process_uploaded_file(path, ext, filename)
+            jobs.append((filename, ext, save_upload(file)))
+
+        except Exception as e:
+            traceback.print_exc()
+            all_results.append({"filename": file.filename, "error": str(e)})
+
+    ocr_results = await asyncio.gather(
+        *(_ocr(path, ext) for _, ext, path in jobs), return_exceptions=True
+    )
+
+    # Start from a clean index once for the whole batch; files are appended
+    if jobs:
+        reset_indexes()
+    pending = []
+
+    for (filename, ext, _), ocr_result in zip(jobs, ocr_results):
+        try:
+            if isinstance(ocr_result, BaseException):
+                raise ocr_result
+            result = index_ocr_result(ocr_result, ext, filename, reset=False, pending=pending)
             total_chunks += result.get("chunks_indexed", 0)
             total_tables += result.get("tables_detected", 0)
             all_results.append(result)
 
         except Exception as e:
             traceback.print_exc()
-            all_results.append({"filename": file.filename, "error": str(e)})
+            all_results.append({"filename": filename, "error": str(e)})
+
+    flush_vectors(pending, namespace="default")
 
     return {
         "message": "✅ Batch upload completed using Vision OCR",
@@ -192,10 +294,15 @@ async def batch_upload(files: list[UploadFile] = File(...)):
         "total_chunks_indexed": total_chunks,
         "total_tables_detected": total_tables,
         "results": all_results,
-        "timestamp": datetime.now().isoformat()
+        "timestamp": now_iso()
     }
 
 
+def _cacheable(context_texts: list, answer: str, failed: bool = False) -> bool:
+    """Only real answers grounded in retrieved context may be cached and replayed."""
+    return bool(context_texts) and bool(answer.strip()) and not failed and not isinstance(answer, FailedAnswer)
+
+
 # -------------------------------------------------------------
 # ✅ HYBRID ASK (Single-turn Query)
 # -------------------------------------------------------------
@@ -211,13 +318,20 @@ async def ask(
             cached["cached"] = True
             return cached
 
-        results = hybrid_search(question, alpha=alpha, top_k=top_k)
+        # Near-duplicate questions reuse a prior answer
+        cache_context = f"ask:{alpha}:{top_k}"
+        question_emb = embed_query(question)
+        hit = answer_cache.lookup(question_emb, context=cache_context)
+        if hit:
+            return {**hit, "question": question, "cached": True}
+
+        results = hybrid_search(question, alpha=alpha, top_k=top_k, query_emb=question_emb)
         if not results:
             return {
                 "question": question,
                 "context_used": [],
                 "answer": "No relevant information found",
-                "timestamp": datetime.now().isoformat()
+                "timestamp": now_iso()
             }
 
         context_texts = [r["text"] for r in results]
@@ -227,10 +341,12 @@ async def ask(
             "question": question,
             "context_used": context_texts,
             "answer": answer,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": now_iso()
         }
 
-        cache_answer(question, response)
+        if _cacheable(context_texts, answer):
+            cache_answer(question, response)
+            answer_cache.insert(question_emb, response, context=cache_context)
         return response
 
     except Exception as e:
@@ -240,13 +356,87 @@ async def ask(
             "context_used": [],
             "answer": "⚠️ Server error while answering",
             "error": str(e),
-            "timestamp": datetime.now().isoformat()
+            "timestamp": now_iso()
         }
 
 
 # -------------------------------------------------------------
 # ✅ CONVERSATIONAL CHAT ENDPOINT (Multi-turn)
 # -------------------------------------------------------------
+def _chat_turn_setup(question: str, session_id: str, alpha: float, top_k: int) -> dict:
+    """History, semantic-cache lookup and the optional summary task for one chat turn."""
+    # Retrieve chat history
+    history = get_memory(session_id)
+    past_context = "\n".join([f"{m['role'].upper()}: {m['content']}" for m in history[-5:]])
+
+    # Near-duplicate questions in the same recent conversation reuse a prior answer
+    recent_turns = "\x00".join(m["content"] for m in history[-3:])
+    cache_context = f"chat:{alpha}:{top_k}:" + hashlib.blake2b(
+        recent_turns.encode("utf-8"), digest_size=16
+    ).hexdigest()
+    question_emb = embed_query(question)
+    hit = answer_cache.lookup(question_emb, context=cache_context)
+
+    # Auto-summarize memory after 10+ turns — independent of this turn's
+    # answer, so it runs concurrently with answer generation
+    summary_task = None
+    if len(history) > 10:
+        summary_prompt = f"Summarize the key points of this conversation:\n{past_context}"
+        summary_task = asyncio.create_task(agenerate_answer([summary_prompt], "Summarize"))
+
+    return {
+        "history": history,
+        "past_context": past_context,
+        "cache_context": cache_context,
+        "question_emb": question_emb,
+        "hit": hit,
+        "summary_task": summary_task,
+    }
+
+
+def _remember_chat_answer(turn: dict, context_texts: list, answer: str, failed: bool = False):
+    """Semantic-cache a finished chat answer, unless it is an error or context-free reply."""
+    if _cacheable(context_texts, answer, failed):
+        answer_cache.insert(
+            turn["question_emb"], {"context_used": context_texts, "answer": answer},
+            context=turn["cache_context"]
+        )
+
+
+def _chat_prompt(past_context: str, context_texts: list, question: str) -> str:
+    """Combine conversation + context in a single join."""
+    parts = ["Previous conversation:\n", past_context, "\n\nRelevant context from uploaded docs:\n"]
+    parts.extend(f"{t}\n" for t in context_texts)
+    parts.append(f"\nQuestion: {question}")
+    return "".join(parts)
+
+
+async def _chat_turn_finish(session_id: str, question: str, answer: str, summary_task):
+    """Update memory, folding in the auto-summary if one was started."""
+    add_to_memory(session_id, "user", question)
+    add_to_memory(session_id, "assistant", answer)
+
+    if summary_task:
+        summary = await summary_task
+        if isinstance(summary, FailedAnswer):
+            print(f"⚠️ Auto-summary failed for session {session_id} — keeping full history")
+            return
+        clear_memory(session_id)
+        add_to_memory(session_id, "system", summary)
+        print(f"🧠 Auto-summarized session {session_id}")
+
+
+def _discard_summary_task(turn):
+    """Cancel (or reap) a summary task the turn never awaited — on errors or client disconnect."""
+    task = turn and turn["summary_task"]
+    if not task:
+        return
+    if not task.done():
+        task.cancel()
+    elif not task.cancelled():
+        task.exception()  # mark retrieved so asyncio doesn't log it
+
+
 @app.post("/chat")
 async def chat(
     question: str = Query(..., description="User's question"),
@@ -254,48 +444,101 @@ async def chat(
     alpha: float = Query(0.5, description="Hybrid search weight"),
     top_k: int = Query(5, description="Context results")
 ):
+    turn = None
     try:
-        # Retrieve chat history
-        history = get_memory(session_id)
-        past_context = "\n".join([f"{m['role'].upper()}: {m['content']}" for m in history[-5:]])
+        turn = _chat_turn_setup(question, session_id, alpha, top_k)
+        history, hit = turn["history"], turn["hit"]
 
-        # Hybrid document search
-        results = hybrid_search(question, alpha=alpha, top_k=top_k)
-        context_texts = [r["text"] for r in results]
+        if hit:
+            context_texts, answer = hit["context_used"], hit["answer"]
+        else:
+            # Hybrid document search
+            results = hybrid_search(question, alpha=alpha, top_k=top_k, query_emb=turn["question_emb"])
+            context_texts = [r["text"] for r in results]
 
-        # Combine conversation + context
-        combined_context = (
-            "Previous conversation:\n"
-            + past_context
-            + "\n\nRelevant context from uploaded docs:\n"
-            + "\n".join(context_texts)
-            + f"\n\nQuestion: {question}"
-        )
-
-        # Generate LLM answer
-        answer = generate_answer([combined_context], question)
+            # Generate LLM answer
+            combined_context = _chat_prompt(turn["past_context"], context_texts, question)
+            answer = await agenerate_answer([combined_context], question)
+            _remember_chat_answer(turn, context_texts, answer)
 
-        # Update memory
-        add_to_memory(session_id, "user", question)
-        add_to_memory(session_id, "assistant", answer)
-
-        # Auto-summarize memory after 10+ turns
-        if len(history) > 10:
-            summary_prompt = f"Summarize the key points of this conversation:\n{past_context}"
-            summary = generate_answer([summary_prompt], "Summarize")
-            clear_memory(session_id)
-            add_to_memory(session_id, "system", summary)
-            print(f"🧠 Auto-summarized session {session_id}")
+        await _chat_turn_finish(session_id, question, answer, turn["summary_task"])
 
         return {
             "session_id": session_id,
             "question": question,
             "context_used": context_texts,
             "answer": answer,
-            "timestamp": datetime.now().isoformat(),
+            "cached": bool(hit),
+            "timestamp": now_iso(),
             "turns_in_memory": len(history) + 1
         }
 
     except Exception as e:
         traceback.print_exc()
         return {"error": str(e)}
+    finally:
+        _discard_summary_task(turn)
+
+
+# -------------------------------------------------------------
+# ✅ STREAMING CHAT (Server-Sent Events)
+# -------------------------------------------------------------
+def _sse(payload: dict) -> str:
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+@app.post("/chat/stream")
+async def chat_stream(
+    question: str = Query(..., description="User's question"),
+    session_id: str = Query("default", description="Session ID for memory"),
+    alpha: float = Query(0.5, description="Hybrid search weight"),
+    top_k: int = Query(5, description="Context results")
+):
+    """
+    Same turn as /chat, but the answer is streamed as it is generated.
+    Emits `{"delta": ...}` events, then one final event with the /chat metadata.
+    """
+    async def events():
+        turn = None
+        try:
+            turn = _chat_turn_setup(question, session_id, alpha, top_k)
+            hit = turn["hit"]
+
+            if hit:
+                context_texts, answer = hit["context_used"], hit["answer"]
+                yield _sse({"delta": answer})
+            else:
+                results = hybrid_search(
+                    question, alpha=alpha, top_k=top_k, query_emb=turn["question_emb"]
+                )
+                context_texts = [r["text"] for r in results]
+
+                combined_context = _chat_prompt(turn["past_context"], context_texts, question)
+                pieces, failed = [], False
+                async for delta in astream_answer([combined_context], question):
+                    failed = failed or isinstance(delta, FailedAnswer)
+                    pieces.append(delta)
+                    yield _sse({"delta": delta})
+                # Reached only when the stream ran to completion (a disconnect closes the generator)
+                answer = "".join(pieces)
+                _remember_chat_answer(turn, context_texts, answer, failed)
+
+            await _chat_turn_finish(session_id, question, answer, turn["summary_task"])
+
+            yield _sse({
+                "done": True,
+                "session_id": session_id,
+                "question": question,
+                "context_used": context_texts,
+                "cached": bool(hit),
+                "timestamp": now_iso(),
+                "turns_in_memory": len(turn["history"]) + 1
+            })
+
+        except Exception as e:
+            traceback.print_exc()
+            yield _sse({"error": str(e)})
+        finally:
+            _discard_summary_task(turn)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
@@ -1,39 +1,258 @@
-from rank_bm25 import BM25Okapi
 import pickle
 import os
-import re
+import hashlib
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from typing import List, Dict, Any
 
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from services.tokenizer import _tokenize_text
+
+# --- Numba (optional) ---
+try:
+    from numba import njit, prange
+    _NUMBA_ENABLED = True
+except Exception as e:
+    print("⚠️ Numba not available — BM25 scoring falls back to scipy:", e)
+    _NUMBA_ENABLED = False
+
+# --- msgpack + zstd snapshot (optional, pickle otherwise) ---
+try:
+    import msgpack
+    import zstandard
+    _MSGPACK_ENABLED = True
+except Exception as e:
+    print("⚠️ msgpack/zstandard not available — BM25 snapshot stays pickle:", e)
+    _MSGPACK_ENABLED = False
+
+# Batches at least this large are tokenized across worker processes
+BM25_PARALLEL_MIN_DOCS = int(os.getenv("BM25_PARALLEL_MIN_DOCS", "5000"))
+
+
+def _doc_key(text: str) -> bytes:
+    """Fixed 8-byte digest used for dedup instead of keeping every chunk twice."""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest()
+
+
+def _tokenize_many(texts: List[str]) -> List[List[str]]:
+    """Tokenize a batch, fanning out to all cores for large ingestions."""
+    workers = os.cpu_count() or 1
+    if len(texts) < BM25_PARALLEL_MIN_DOCS or workers < 2:
+        return [_tokenize_text(t) for t in texts]
+
+    # spawn, not fork: this process has live threads and gRPC/Redis clients.
+    # Workers import only services.tokenizer, so the index is never reloaded
+    chunksize = max(1, len(texts) // (4 * workers))
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as ex:
+        return list(ex.map(_tokenize_text, texts, chunksize=chunksize))
+
+
+if _NUMBA_ENABLED:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _bm25_scores(data, indices, indptr, query_weights, out):
+        """Per-document dot product of weighted TF rows with the query weights."""
+        for i in prange(out.shape[0]):
+            s = 0.0
+            for p in range(indptr[i], indptr[i + 1]):
+                s += data[p] * query_weights[indices[p]]
+            out[i] = s
+
+
+def _warm_up_kernel():
+    """JIT-compile the scoring kernel up front so the first query isn't cold."""
+    if not _NUMBA_ENABLED:
+        return
+    try:
+        for idx_dtype in (np.int32, np.int64):
+            _bm25_scores(
+                np.ones(1), np.zeros(1, dtype=idx_dtype), np.array([0, 1], dtype=idx_dtype),
+                np.ones(1), np.empty(1),
+            )
+    except Exception as e:
+        print(f"⚠️ BM25 kernel warm-up failed: {e}")
+
+
+class IncrementalBM25:
+    """
+    Okapi BM25 scorer that grows with the corpus.
+    ---------------------------------------
+    - Same scoring as rank_bm25.BM25Okapi (k1, b, epsilon IDF floor)
+    - Corpus stored as a CSR term-frequency matrix (rows=docs, cols=vocab)
+    - add() only appends the new documents' rows
+    - IDF and length-normalized weights are rebuilt lazily after a mutation
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25):
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        self.vocab: Dict[str, int] = {}
+        self.term_df: List[int] = []
+        self.avgdl = 0.0
+        self._indptr: List[int] = [0]
+        self._indices: List[int] = []
+        self._data: List[float] = []
+        self._doc_len: List[int] = []
+        self._idf = np.zeros(0)
+        self._tf_csr = None
+        self._dirty = False
+
+    @property
+    def corpus_size(self) -> int:
+        return len(self._doc_len)
+
+    def _thaw(self):
+        """Arrays restored from disk become lists again on first append."""
+        if isinstance(self._indices, np.ndarray):
+            self.term_df = self.term_df.tolist()
+            self._indptr = self._indptr.tolist()
+            self._indices = self._indices.tolist()
+            self._data = self._data.tolist()
+            self._doc_len = self._doc_len.tolist()
+
+    def add(self, tokenized_docs: List[List[str]]):
+        """Append tokenized documents; cost is O(new tokens)."""
+        if tokenized_docs:
+            self._thaw()
+        for tokens in tokenized_docs:
+            for term, tf in Counter(tokens).items():
+                col = self.vocab.get(term)
+                if col is None:
+                    col = self.vocab[term] = len(self.term_df)
+                    self.term_df.append(0)
+                self.term_df[col] += 1
+                self._indices.append(col)
+                self._data.append(tf)
+            self._indptr.append(len(self._indices))
+            self._doc_len.append(len(tokens))
+        if tokenized_docs:
+            self._dirty = True
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Raw vocab + CSR counts + IDF stats, so a restart skips re-indexing."""
+        if self._dirty:
+            self._rebuild()
+        # Tokens are [a-z0-9]+, so a newline-joined blob round-trips safely
+        return {
+            "terms": np.frombuffer("\n".join(self.vocab).encode("utf-8"), dtype=np.uint8),
+            "term_df": np.asarray(self.term_df, dtype=np.int64),
+            "indptr": np.asarray(self._indptr, dtype=np.int64),
+            "indices": np.asarray(self._indices, dtype=np.int64),
+            "data": np.asarray(self._data, dtype=np.int64),
+            "doc_len": np.asarray(self._doc_len, dtype=np.int64),
+            "idf": self._idf,
+            "avgdl": np.float64(self.avgdl),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays) -> "IncrementalBM25":
+        """Inverse of to_arrays(); arrays stay NumPy until the next add()."""
+        model = cls()
+        terms = arrays["terms"].tobytes().decode("utf-8")
+        model.vocab = {t: i for i, t in enumerate(terms.split("\n"))} if terms else {}
+        model.term_df = arrays["term_df"]
+        model._indptr = arrays["indptr"]
+        model._indices = arrays["indices"]
+        model._data = arrays["data"]
+        model._doc_len = arrays["doc_len"]
+
+        if "idf" in arrays and arrays["idf"].size == len(model.vocab):
+            # Persisted stats: only the weighted matrix needs building
+            model._idf = arrays["idf"]
+            model.avgdl = float(arrays["avgdl"])
+            model._build_weights()
+        else:
+            model._dirty = model.corpus_size > 0
+        return model
+
+    def _rebuild(self):
+        """Recompute IDF and the BM25-weighted TF matrix in vectorized form."""
+        n = self.corpus_size
+        doc_len = np.asarray(self._doc_len, dtype=np.float64)
+        self.avgdl = float(doc_len.mean()) if n else 0.0
+
+        # IDF (negative IDFs floored like BM25Okapi)
+        df = np.asarray(self.term_df, dtype=np.float64)
+        idf = np.log(n - df + 0.5) - np.log(df + 0.5)
+        if idf.size:
+            idf[idf < 0] = self.epsilon * idf.mean()
+        self._idf = idf
+        self._build_weights()
+
+    def _build_weights(self):
+        """BM25-weighted TF matrix from the current counts, IDF and avgdl."""
+        n = self.corpus_size
+        doc_len = np.asarray(self._doc_len, dtype=np.float64)
+
+        # Per-entry saturation: tf*(k1+1) / (tf + k1*(1-b+b*|d|/avgdl))
+        indptr = np.asarray(self._indptr, dtype=np.int64)
+        tf = np.asarray(self._data, dtype=np.float64)
+        norm = self.k1 * (1 - self.b + self.b * doc_len / self.avgdl) if self.avgdl else doc_len
+        rows = np.repeat(np.arange(n), np.diff(indptr))
+        weights = tf * (self.k1 + 1) / (tf + norm[rows])
+        self._tf_csr = csr_matrix(
+            (weights, np.asarray(self._indices, dtype=np.int64), indptr),
+            shape=(n, len(self.vocab)),
+        )
+        self._dirty = False
+
+    def get_scores(self, query_tokens: List[str]) -> np.ndarray:
+        """BM25 score of every document for the given query tokens."""
+        if self._dirty or self._tf_csr is None:
+            self._rebuild()
+
+        counts = Counter(t for t in query_tokens if t in self.vocab)
+        if not counts:
+            return np.zeros(self.corpus_size)
+        cols = np.fromiter((self.vocab[t] for t in counts), dtype=np.int64)
+        w = self._idf[cols] * np.fromiter(counts.values(), dtype=np.float64)
+
+        if _NUMBA_ENABLED:
+            query_weights = np.zeros(len(self.vocab))
+            query_weights[cols] = w
+            out = np.empty(self.corpus_size)
+            m = self._tf_csr
+            _bm25_scores(m.data, m.indices, m.indptr, query_weights, out)
+            return out
+        return self._tf_csr[:, cols] @ w
+
 
 class BM25Retriever:
     """
     🧠 Enhanced BM25 Retriever for AstraMind
     ---------------------------------------
     - Keyword-based retrieval for hybrid (dense + sparse) RAG
-    - Supports persistence across restarts (via pickle)
+    - Supports persistence across restarts (msgpack+zstd snapshot, pickle log)
     - Compatible with Pinecone hybrid search
     - Includes lightweight token cleaning and normalization
     """
 
     def __init__(self, storage_path: str = "bm25_index.pkl"):
         self.storage_path = storage_path
+        self.log_path = f"{storage_path}.log"
+        # The msgpack+zstd snapshot sits next to the legacy pickle, which is
+        # still read (and then replaced) if it is the only one on disk
+        self.snapshot_path = (
+            f"{os.path.splitext(storage_path)[0]}.msgpack.zst" if _MSGPACK_ENABLED else storage_path
+        )
+        self._snapshot_bytes = 0   # uncompressed snapshot size, paces compaction
+        self.state_path = f"{os.path.splitext(storage_path)[0]}.bm25.npz"
         self.documents: List[str] = []
         self.tokenized_docs: List[List[str]] = []
+        self._doc_set = set()
         self.bm25 = None
+        _warm_up_kernel()
         self._load()
 
     # ------------------------------------------------------------
     # ✅ Text Cleaning & Tokenization
     # ------------------------------------------------------------
-    def _clean_text(self, text: str) -> str:
-        """Clean text: remove symbols and extra spaces."""
-        text = re.sub(r"[^a-zA-Z0-9\s]", " ", text)
-        return re.sub(r"\s+", " ", text.strip().lower())
-
     def _tokenize(self, text: str) -> List[str]:
-        """Tokenize text safely (clean + lowercase split)."""
-        cleaned = self._clean_text(text)
-        return cleaned.split()
+        """Tokenize text safely (lowercase [a-z0-9] runs via one bytes.translate table pass)."""
+        return _tokenize_text(text)
 
     # ------------------------------------------------------------
     # ✅ Add Documents
@@ -41,24 +260,33 @@ class BM25Retriever:
     def add_documents(self, docs: List[str]):
         """
         Add new documents to the BM25 index.
-        Automatically skips duplicates and re-trains the index.
+        Automatically skips duplicates and updates the index incrementally.
         """
         if not docs:
             print("⚠️ No documents provided for BM25 indexing.")
             return
 
-        new_docs = [d for d in docs if d.strip() and d not in self.documents]
+        new_docs = []
+        for d in docs:
+            if not d.strip():
+                continue
+            key = _doc_key(d)
+            if key not in self._doc_set:
+                self._doc_set.add(key)
+                new_docs.append(d)
         if not new_docs:
             print("ℹ️ No new or unique documents to add.")
             return
 
-        # Tokenize and update corpus
+        # Tokenize only the new documents and update corpus
+        new_tokens = _tokenize_many(new_docs)
         self.documents.extend(new_docs)
-        self.tokenized_docs.extend([self._tokenize(doc) for doc in new_docs])
+        self.tokenized_docs.extend(new_tokens)
 
-        # Rebuild BM25 model
-        self.bm25 = BM25Okapi(self.tokenized_docs)
-        self._save()
+        if self.bm25 is None:
+            self.bm25 = IncrementalBM25()
+        self.bm25.add(new_tokens)
+        self._save(new_docs, new_tokens)
         print(f"✅ BM25 index updated with {len(new_docs)} new documents. Total: {len(self.documents)}")
 
     # ------------------------------------------------------------
@@ -79,8 +307,15 @@ class BM25Retriever:
             return []
 
         scores = self.bm25.get_scores(query_tokens)
-        ranked = sorted(zip(self.documents, scores), key=lambda x: x[1], reverse=True)
-        results = [{"text": doc, "score": float(score)} for doc, score in ranked[:top_k]]
+
+        # Top-k selection in O(N), then sort only the k survivors
+        k = min(top_k, scores.size)
+        if k <= 0:
+            return []
+        idx = np.argpartition(-scores, k - 1)[:k] if k < scores.size else np.arange(scores.size)
+        idx = np.sort(idx)
+        idx = idx[np.argsort(-scores[idx], kind="stable")]
+        results = [{"text": self.documents[i], "score": float(scores[i])} for i in idx]
 
         return results
 
@@ -93,49 +328,139 @@ class BM25Retriever:
     # ✅ Reset BM25 Index
     # ------------------------------------------------------------
     def reset(self):
-        """Completely clears BM25 index and persistent file."""
+        """Completely clears BM25 index and persistent files."""
         self.documents = []
         self.tokenized_docs = []
+        self._doc_set = set()
         self.bm25 = None
+        self._snapshot_bytes = 0
 
-        if os.path.exists(self.storage_path):
-            try:
-                os.remove(self.storage_path)
-                print("🧹 Removed BM25 persistent file.")
-            except Exception as e:
-                print(f"⚠️ Failed to remove BM25 file: {e}")
+        for path in {self.snapshot_path, self.storage_path, self.log_path, self.state_path}:
+            if os.path.exists(path):
+                try:
+                    os.remove(path)
+                    print(f"🧹 Removed BM25 persistent file: {path}")
+                except Exception as e:
+                    print(f"⚠️ Failed to remove BM25 file: {e}")
 
         print("✅ BM25 index reset successful.")
 
     # ------------------------------------------------------------
     # ✅ Save & Load
     # ------------------------------------------------------------
-    def _save(self):
-        """Persist the BM25 index to disk."""
+    def _save(self, new_docs: List[str], new_tokens: List[List[str]]):
+        """
+        Persist newly added documents by appending them to the sidecar log.
+        The log is folded into the snapshot once it outgrows it.
+        """
         try:
-            with open(self.storage_path, "wb") as f:
-                pickle.dump({
-                    "documents": self.documents,
-                    "tokenized_docs": self.tokenized_docs
-                }, f)
-            print(f"💾 BM25 index saved ({len(self.documents)} docs).")
+            with open(self.log_path, "ab") as f:
+                f.write(pickle.dumps(
+                    {"documents": new_docs, "tokenized_docs": new_tokens},
+                    protocol=5,
+                ))
+            print(f"💾 BM25 index log appended ({len(new_docs)} new docs).")
+
+            if os.path.getsize(self.log_path) > 2 * self._snapshot_bytes:
+                self.compact()
         except Exception as e:
             print(f"⚠️ Failed to save BM25 index: {e}")
 
+    def compact(self):
+        """Rewrite the full snapshot and truncate the append log."""
+        try:
+            data = {"documents": self.documents, "tokenized_docs": self.tokenized_docs}
+            if _MSGPACK_ENABLED:
+                raw = msgpack.packb(data, use_bin_type=True)
+                blob = zstandard.ZstdCompressor(level=3).compress(raw)
+            else:
+                raw = blob = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+
+            # Index state first: a state file from an older snapshot is
+            # detected on load by its doc count and simply rebuilt
+            if self.bm25 is not None:
+                tmp_state = f"{self.state_path}.tmp.npz"
+                np.savez(tmp_state, n_docs=len(self.documents), **self.bm25.to_arrays())
+                os.replace(tmp_state, self.state_path)
+
+            tmp_path = f"{self.snapshot_path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(blob)
+            os.replace(tmp_path, self.snapshot_path)
+            self._snapshot_bytes = len(raw)
+
+            stale = [self.log_path]
+            if self.snapshot_path != self.storage_path:
+                stale.append(self.storage_path)
+            for path in stale:
+                if os.path.exists(path):
+                    os.remove(path)
+            print(f"💾 BM25 index snapshot saved ({len(self.documents)} docs).")
+        except Exception as e:
+            print(f"⚠️ Failed to compact BM25 index: {e}")
+
     def _load(self):
-        """Load saved BM25 documents from disk (if available)."""
-        if os.path.exists(self.storage_path):
-            try:
+        """Load saved BM25 documents from disk (snapshot + append log)."""
+        try:
+            data = None
+            if _MSGPACK_ENABLED and os.path.exists(self.snapshot_path):
+                with open(self.snapshot_path, "rb") as f:
+                    raw = zstandard.ZstdDecompressor().decompress(f.read())
+                data = msgpack.unpackb(raw, raw=False)
+                self._snapshot_bytes = len(raw)
+            elif os.path.exists(self.storage_path):
                 with open(self.storage_path, "rb") as f:
                     data = pickle.load(f)
-                    self.documents = data.get("documents", [])
-                    self.tokenized_docs = data.get("tokenized_docs", [])
-
-                if self.documents:
-                    self.bm25 = BM25Okapi(self.tokenized_docs)
-                    print(f"✅ Loaded BM25 index with {len(self.documents)} documents.")
-            except Exception as e:
-                print(f"⚠️ Failed to load BM25 index: {e}")
+                self._snapshot_bytes = os.path.getsize(self.storage_path)
+
+            if data:
+                self.documents = data.get("documents", [])
+                self.tokenized_docs = data.get("tokenized_docs", [])
+            snapshot_docs = len(self.documents)
+
+            if os.path.exists(self.log_path):
+                good_offset = 0  # end of the last fully decoded entry
+                with open(self.log_path, "rb") as f:
+                    while True:
+                        try:
+                            entry = pickle.load(f)
+                        except Exception:
+                            break  # clean EOF, or a torn/corrupt entry
+                        self.documents.extend(entry.get("documents", []))
+                        self.tokenized_docs.extend(entry.get("tokenized_docs", []))
+                        good_offset = f.tell()
+                # Cut off a damaged tail so later appends don't land behind it
+                # (the next load would otherwise stop there and drop them)
+                if os.path.getsize(self.log_path) > good_offset:
+                    print("⚠️ BM25 log has a truncated entry — discarding the damaged tail.")
+                    os.truncate(self.log_path, good_offset)
+
+            if self.documents:
+                self._doc_set = {_doc_key(d) for d in self.documents}
+                self.bm25 = self._load_state(snapshot_docs)
+                if self.bm25 is None:
+                    self.bm25 = IncrementalBM25()
+                    self.bm25.add(self.tokenized_docs)
+                else:
+                    # Only documents replayed from the log still need indexing
+                    self.bm25.add(self.tokenized_docs[snapshot_docs:])
+                print(f"✅ Loaded BM25 index with {len(self.documents)} documents.")
+        except Exception as e:
+            print(f"⚠️ Failed to load BM25 index: {e}")
+
+    def _load_state(self, snapshot_docs: int):
+        """Restore the persisted index if it matches the snapshot, else None."""
+        if not snapshot_docs or not os.path.exists(self.state_path):
+            return None
+        try:
+            with np.load(self.state_path) as arrays:
+                if int(arrays["n_docs"]) != snapshot_docs:
+                    print("⚠️ BM25 index state is stale — rebuilding from tokens.")
+                    return None
+                return IncrementalBM25.from_arrays(arrays)
+        except Exception as e:
+            print(f"⚠️ Failed to load BM25 index state: {e}")
+            return None
 
     # ------------------------------------------------------------
     # ✅ Utility Functions
@@ -2,9 +2,19 @@ import redis
 import os
 import json
 import time
-from datetime import datetime
+import hashlib
+import numpy as np
+from services.timeutils import now_iso
 from dotenv import load_dotenv
 
+# --- orjson (optional, much faster than stdlib json) ---
+try:
+    import orjson
+    _ORJSON_ENABLED = True
+    _ORJSON_OPTS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+except Exception:
+    _ORJSON_ENABLED = False
+
 # -------------------------------------------------------------
 # ✅ Load Configuration
 # -------------------------------------------------------------
@@ -14,22 +24,30 @@ REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
 REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
 REDIS_DB = int(os.getenv("REDIS_DB", "0"))
 CACHE_TTL = int(os.getenv("CACHE_TTL", "3600"))  # Default 1 hour
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "32"))
+OCR_CACHE_TTL = int(os.getenv("OCR_CACHE_TTL", "86400"))  # Default 1 day
 
 # -------------------------------------------------------------
 # ✅ Initialize Redis Connection
 # -------------------------------------------------------------
-def _get_redis_client():
+def _get_redis_client(decode_responses: bool = True):
     try:
-        client = redis.Redis(
+        # Bounded pool: under load, callers wait up to 3 s for a free
+        # connection instead of opening an unbounded number of sockets
+        pool = redis.BlockingConnectionPool(
             host=REDIS_HOST,
             port=REDIS_PORT,
             db=REDIS_DB,
-            decode_responses=True,
+            decode_responses=decode_responses,
             socket_timeout=3,
             socket_connect_timeout=3,
+            max_connections=REDIS_MAX_CONNECTIONS,
+            timeout=3,
         )
+        client = redis.Redis(connection_pool=pool)
         client.ping()
-        print(f"✅ Connected to Redis (cache) at {REDIS_HOST}:{REDIS_PORT} [DB {REDIS_DB}]")
+        kind = "cache" if decode_responses else "binary cache"
+        print(f"✅ Connected to Redis ({kind}) at {REDIS_HOST}:{REDIS_PORT} [DB {REDIS_DB}]")
         return client
     except redis.exceptions.ConnectionError:
         print("⚠️ Redis cache server not reachable. Caching will be disabled.")
@@ -37,12 +55,20 @@ def _get_redis_client():
 
 
 redis_client = _get_redis_client()
+# Raw-bytes client for packed vectors (decode_responses is a per-pool
+# connection setting, so it gets its own pool)
+redis_bytes_client = _get_redis_client(decode_responses=False) if redis_client else None
 
 
 # -------------------------------------------------------------
 # ✅ Utility Serialization Functions
 # -------------------------------------------------------------
 def _safe_json_dumps(data):
+    if _ORJSON_ENABLED:
+        try:
+            return orjson.dumps(data, default=str, option=_ORJSON_OPTS)
+        except Exception:
+            pass  # e.g. ints beyond 64 bits — let stdlib json handle it
     try:
         return json.dumps(data, default=str)
     except Exception as e:
@@ -52,6 +78,8 @@ def _safe_json_dumps(data):
 
 def _safe_json_loads(data):
     try:
+        if _ORJSON_ENABLED:
+            return orjson.loads(data)
         return json.loads(data)
     except Exception as e:
         print(f"⚠️ JSON deserialization error: {e}")
@@ -61,13 +89,19 @@ def _safe_json_loads(data):
 # -------------------------------------------------------------
 # ✅ Core Caching Functions
 # -------------------------------------------------------------
+def _qa_key(question: str) -> str:
+    """Fixed-size key (32 hex chars) however long the question is."""
+    digest = hashlib.blake2b(question.strip().lower().encode("utf-8"), digest_size=16).hexdigest()
+    return f"astramind:qa:{digest}"
+
+
 def cache_answer(question: str, answer: dict):
     """Cache a question-answer pair with TTL."""
     if not redis_client:
         return
     try:
-        key = f"astramind:qa:{question.lower()}"
-        payload = {"data": answer, "cached_at": datetime.now().isoformat()}
+        key = _qa_key(question)
+        payload = {"question": question, "data": answer, "cached_at": now_iso()}
         redis_client.setex(key, CACHE_TTL, _safe_json_dumps(payload))
         print(f"🧠 Cached answer → {question[:60]}...")
     except Exception as e:
@@ -79,7 +113,7 @@ def get_cached_answer(question: str):
     if not redis_client:
         return None
     try:
-        key = f"astramind:qa:{question.lower()}"
+        key = _qa_key(question)
         result = redis_client.get(key)
         if not result:
             return None
@@ -106,7 +140,7 @@ def cache_document_info(doc_name: str, meta: dict):
         return
     try:
         key = f"astramind:doc:{doc_name}"
-        meta["timestamp"] = datetime.now().isoformat()
+        meta["timestamp"] = now_iso()
         redis_client.setex(key, CACHE_TTL * 6, _safe_json_dumps(meta))
         print(f"📄 Cached metadata for: {doc_name}")
     except Exception as e:
@@ -129,13 +163,27 @@ def get_document_info(doc_name: str):
 # -------------------------------------------------------------
 # ✅ Embedding Vector Caching
 # -------------------------------------------------------------
+# Vectors are stored as packed float16 (2 bytes/dim instead of ~20 chars of
+# JSON per float); the key prefix changed with the format, so old JSON
+# entries are never misread and simply expire.
+def _embedding_key(text_hash: str) -> str:
+    return f"astramind:embedding16:{text_hash}"
+
+
+def _pack_vector(vector) -> bytes:
+    return np.asarray(vector, dtype=np.float16).tobytes()
+
+
+def _unpack_vector(raw: bytes):
+    return np.frombuffer(raw, dtype=np.float16).astype(np.float32).tolist()
+
+
 def cache_embedding(text_hash: str, vector: list):
     """Cache embedding vectors for repeated queries."""
-    if not redis_client:
+    if not redis_bytes_client:
         return
     try:
-        key = f"astramind:embedding:{text_hash}"
-        redis_client.setex(key, CACHE_TTL * 12, _safe_json_dumps(vector))
+        redis_bytes_client.setex(_embedding_key(text_hash), CACHE_TTL * 12, _pack_vector(vector))
         print(f"💾 Cached embedding for hash: {text_hash[:10]}...")
     except Exception as e:
         print(f"⚠️ Embedding cache error: {e}")
@@ -143,14 +191,70 @@ def cache_embedding(text_hash: str, vector: list):
 
 def get_cached_embedding(text_hash: str):
     """Retrieve cached embedding vector."""
+    if not redis_bytes_client:
+        return None
+    try:
+        result = redis_bytes_client.get(_embedding_key(text_hash))
+        return _unpack_vector(result) if result else None
+    except Exception as e:
+        print(f"⚠️ Embedding retrieval failed: {e}")
+        return None
+
+
+def get_cached_embeddings_bulk(text_hashes: list):
+    """Retrieve many cached vectors in one MGET; None where missing."""
+    if not redis_bytes_client or not text_hashes:
+        return [None] * len(text_hashes)
+    try:
+        results = redis_bytes_client.mget([_embedding_key(h) for h in text_hashes])
+        return [_unpack_vector(r) if r else None for r in results]
+    except Exception as e:
+        print(f"⚠️ Bulk embedding retrieval failed: {e}")
+        return [None] * len(text_hashes)
+
+
+def cache_embeddings_bulk(pairs: list):
+    """Cache many (text_hash, vector) pairs in one pipelined round-trip."""
+    if not redis_bytes_client or not pairs:
+        return
+    try:
+        pipe = redis_bytes_client.pipeline(transaction=False)
+        for text_hash, vector in pairs:
+            pipe.setex(_embedding_key(text_hash), CACHE_TTL * 12, _pack_vector(vector))
+        pipe.execute()
+        print(f"💾 Cached {len(pairs)} embeddings")
+    except Exception as e:
+        print(f"⚠️ Bulk embedding cache error: {e}")
+
+
+# -------------------------------------------------------------
+# ✅ OCR Result Caching (keyed by file content hash)
+# -------------------------------------------------------------
+def cache_ocr_result(file_hash: str, kind: str, result):
+    """Cache the OCR output for a file so re-uploads skip the OCR pipeline."""
+    if not redis_client:
+        return
+    try:
+        key = f"astramind:ocr:{kind}:{file_hash}"
+        redis_client.setex(key, OCR_CACHE_TTL, _safe_json_dumps(result))
+        print(f"💾 Cached OCR result for hash: {file_hash[:10]}...")
+    except Exception as e:
+        print(f"⚠️ OCR cache error: {e}")
+
+
+def get_cached_ocr_result(file_hash: str, kind: str):
+    """Retrieve cached OCR output for a file hash."""
     if not redis_client:
         return None
     try:
-        key = f"astramind:embedding:{text_hash}"
+        key = f"astramind:ocr:{kind}:{file_hash}"
         result = redis_client.get(key)
-        return _safe_json_loads(result) if result else None
+        if not result:
+            return None
+        print(f"⚡ OCR cache hit → {file_hash[:10]}...")
+        return _safe_json_loads(result)
     except Exception as e:
-        print(f"⚠️ Embedding retrieval failed: {e}")
+        print(f"⚠️ OCR cache retrieval failed: {e}")
         return None
 
 
@@ -1,9 +1,17 @@
 import os
 import hashlib
 import time
+import threading
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 import google.generativeai as genai
-from services.cache import get_cached_embedding, cache_embedding
+from services.cache import (
+    get_cached_embedding,
+    cache_embedding,
+    get_cached_embeddings_bulk,
+    cache_embeddings_bulk,
+)
 
 load_dotenv()
 
@@ -18,7 +26,45 @@ EMBED_MODEL = os.getenv("EMBED_MODEL", "text-embedding-004")
 # ✅ Expected dimension (for Pinecone check)
 EXPECTED_DIM = int(os.getenv("EMBED_DIM", "1024"))
 
-
+# ✅ Batch settings: texts per API call, parallel calls, API calls per second
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "100"))
+EMBED_MAX_WORKERS = int(os.getenv("EMBED_MAX_WORKERS", "4"))
+EMBED_RATE_PER_SEC = float(os.getenv("EMBED_RATE_PER_SEC", "5"))
+
+
+class _RateLimiter:
+    """
+    Token bucket: callers only sleep once the per-second quota is used up.
+    rate <= 0 disables limiting; the bucket holds at least one token so
+    fractional rates (e.g. 0.5/s) still admit a call every 1/rate seconds.
+    """
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.capacity = max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+_rate_limiter = _RateLimiter(EMBED_RATE_PER_SEC)
+
+
+@lru_cache(maxsize=10_000)
 def _normalize_text(text: str) -> str:
     """Clean and truncate text to safe length for embedding."""
     text = text.strip().replace("\n", " ")
@@ -27,9 +73,10 @@ def _normalize_text(text: str) -> str:
     return text
 
 
+@lru_cache(maxsize=10_000)
 def _text_hash(text: str) -> str:
-    """Create a unique hash for caching."""
-    return hashlib.md5(text.encode("utf-8")).hexdigest()
+    """Create a unique hash for caching (memoized for repeat queries)."""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
 
 
 def embed_text(text: str) -> list[float]:
@@ -61,20 +108,83 @@ def embed_text(text: str) -> list[float]:
         return None
 
 
+@lru_cache(maxsize=1024)
+def _embed_query_cached(query: str) -> tuple:
+    vector = embed_text(query)
+    if not vector:
+        raise ValueError("Empty embedding returned")  # exceptions are not memoized
+    return tuple(vector)
+
+
 def embed_query(query: str) -> list[float]:
-    """Generate embeddings specifically for queries."""
-    return embed_text(query)
+    """Generate embeddings specifically for queries (exact repeats are memoized)."""
+    try:
+        return list(_embed_query_cached(query))
+    except ValueError:
+        return None
+
+
+def _embed_api_batch(batch: list[str]) -> list[list[float]]:
+    """One Gemini call for up to EMBED_BATCH_SIZE texts."""
+    _rate_limiter.acquire()
+    result = genai.embed_content(model=EMBED_MODEL, content=batch)
+    return result["embedding"]
 
 
 def embed_batch(texts: list[str]) -> list[list[float]]:
-    """Efficient batch embedding for multiple documents."""
-    vectors = []
-    for i, text in enumerate(texts):
-        print(f"🧠 Embedding chunk {i + 1}/{len(texts)}...")
-        vec = embed_text(text)
-        if vec:
-            vectors.append(vec)
+    """
+    Efficient batch embedding for multiple documents.
+    Returns one vector per input (None where embedding failed), in order.
+    Cached texts skip the API; the rest go out in batched, concurrent calls.
+    """
+    normalized = [_normalize_text(t or "") for t in texts]
+    vectors = [None] * len(texts)
+
+    # ✅ Group positions by hash, so identical texts are looked up / embedded once
+    by_hash = {}
+    for i, text in enumerate(normalized):
+        if text:
+            by_hash.setdefault(_text_hash(text), (text, []))[1].append(i)
+
+    # ✅ One MGET for the whole batch
+    hashes = list(by_hash)
+    pending = {}
+    for text_hash, cached_vector in zip(hashes, get_cached_embeddings_bulk(hashes)):
+        if cached_vector:
+            for i in by_hash[text_hash][1]:
+                vectors[i] = cached_vector
         else:
-            print(f"⚠️ Skipped embedding for chunk {i + 1}")
-        time.sleep(0.2)  # Rate-limit safety for free/student API tiers
+            pending[text_hash] = by_hash[text_hash]
+
+    if pending:
+        items = list(pending.items())
+        batches = [items[s:s + EMBED_BATCH_SIZE] for s in range(0, len(items), EMBED_BATCH_SIZE)]
+        print(f"🧠 Embedding {len(items)} chunks in {len(batches)} API call(s)...")
+
+        def _run(batch):
+            try:
+                return _embed_api_batch([text for _, (text, _) in batch])
+            except Exception as e:
+                print(f"❌ Batch embedding error: {e}")
+                return [None] * len(batch)
+
+        to_cache = []
+        with ThreadPoolExecutor(max_workers=EMBED_MAX_WORKERS) as ex:
+            for batch, batch_vectors in zip(batches, ex.map(_run, batches)):
+                for (text_hash, (_, positions)), vector in zip(batch, batch_vectors):
+                    if not vector:
+                        continue
+                    if isinstance(vector, list) and len(vector) in [EXPECTED_DIM, 768, 1024]:
+                        to_cache.append((text_hash, vector))
+                    else:
+                        print(f"⚠️ Unexpected embedding dimension: {len(vector)}")
+                    for i in positions:
+                        vectors[i] = vector
+
+        # ✅ One pipelined write for every new vector
+        cache_embeddings_bulk(to_cache)
+
+    failed = sum(1 for t, v in zip(normalized, vectors) if t and v is None)
+    if failed:
+        print(f"⚠️ Skipped embedding for {failed} chunks")
     return vectors
@@ -1,17 +1,25 @@
 import os
 import io
+import re
+import shutil
+import hashlib
 import fitz  # PyMuPDF
 import pdfplumber
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from docx import Document
 from typing import List
 from PIL import Image
 
-from services.ocr import multi_stage_ocr
+from services.ocr import multi_stage_ocr, extract_text_from_image as ocr_image
 
 UPLOAD_DIR = "uploads"
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB copy buffer
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+# Sentence boundary: spaces following terminal punctuation
+_SENT_RE = re.compile(r"(?<=[.!?]) +")
+
 
 # ============================================================
 # ✅ File Saving
@@ -19,31 +27,49 @@ os.makedirs(UPLOAD_DIR, exist_ok=True)
 def save_upload(file) -> str:
     """
     Save uploaded file locally in the /uploads directory.
+    Streams in fixed-size chunks so the upload is never fully buffered in RAM.
     """
     path = os.path.join(UPLOAD_DIR, file.filename)
     with open(path, "wb") as f:
-        f.write(file.file.read())
+        shutil.copyfileobj(file.file, f, length=UPLOAD_CHUNK_SIZE)
     print(f"📂 Saved upload: {file.filename}")
     return path
 
 
+def file_sha256(path: str) -> str:
+    """Content hash of a saved upload (hashlib uses SHA-NI where available)."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
 # ============================================================
 # ✅ Smarter Text Chunking
 # ============================================================
+def _iter_sentences(text: str):
+    """Yield sentences lazily instead of materializing the full split list."""
+    start = 0
+    for m in _SENT_RE.finditer(text):
+        yield text[start:m.start()]
+        start = m.end()
+    yield text[start:]
+
+
 def chunk_text(text: str, max_tokens: int = 700, overlap: int = 80) -> List[str]:
     """
     Adaptive chunking for large documents.
     Splits at sentence boundaries when possible for coherence.
     """
-    import re
-
     if not text.strip():
         return []
 
     # Normalize spaces and split sentences
-    sentences = re.split(r'(?<=[.!?]) +', text)
+    sentences = _iter_sentences(text)
     chunks, current_chunk = [], []
 
+    # current_chunk holds (sentence, tokens) so the running count is never recomputed
     token_count = 0
     for sentence in sentences:
         sentence = sentence.strip()
@@ -54,17 +80,16 @@ def chunk_text(text: str, max_tokens: int = 700, overlap: int = 80) -> List[str]
         tokens = len(sentence) // 4
         if token_count + tokens > max_tokens:
             # Create chunk when limit exceeded
-            chunks.append(" ".join(current_chunk).strip())
-            # Keep small overlap
-            overlap_text = current_chunk[-2:] if len(current_chunk) >= 2 else current_chunk[-1:]
-            current_chunk = overlap_text.copy()
-            token_count = sum(len(s) // 4 for s in current_chunk)
+            chunks.append(" ".join(s for s, _ in current_chunk).strip())
+            # Keep small overlap (last two sentences)
+            token_count -= sum(t for _, t in current_chunk[:-2])
+            current_chunk = current_chunk[-2:]
 
-        current_chunk.append(sentence)
+        current_chunk.append((sentence, tokens))
         token_count += tokens
 
     if current_chunk:
-        chunks.append(" ".join(current_chunk).strip())
+        chunks.append(" ".join(s for s, _ in current_chunk).strip())
 
     print(f"✂️ Chunked text into {len(chunks)} parts (~{max_tokens} tokens each).")
     return chunks
@@ -124,16 +149,33 @@ def extract_text_from_pdf(pdf_path: str, max_pages: int = 25) -> List[str]:
 # ============================================================
 # ✅ DOCX Extractor (Paragraphs + Tables + Embedded Images)
 # ============================================================
+def _ocr_text(image) -> str:
+    """Run the OCR chain on an in-memory image (PIL image or encoded bytes)."""
+    text, engine = ocr_image(image)
+    return "" if engine == "None" else text
+
+
 def extract_text_from_docx(file) -> List[str]:
     """
     Extracts text, tables, and OCR from embedded images in DOCX.
     Supports large, multi-section Word documents.
     """
     text_chunks = []
+    ocr_pool = None
     try:
         doc = Document(io.BytesIO(file.file.read()))
         print("📄 Extracting text from DOCX...")
 
+        # 3️⃣ Embedded images: start OCR first (straight from the blobs) so it
+        # runs on worker threads while paragraphs and tables are read below
+        image_blobs = [
+            rel.target_part.blob for rel in doc.part.rels.values() if "image" in rel.target_ref
+        ]
+        ocr_futures = []
+        if image_blobs:
+            ocr_pool = ThreadPoolExecutor(max_workers=min(4, len(image_blobs)))
+            ocr_futures = [ocr_pool.submit(_ocr_text, blob) for blob in image_blobs]
+
         # 1️⃣ Paragraphs
         para_buffer = []
         for para in doc.paragraphs:
@@ -152,27 +194,21 @@ def extract_text_from_docx(file) -> List[str]:
                 if row_text:
                     text_chunks.append(f"TABLE_ROW: {row_text}")
 
-        # 3️⃣ Embedded images (OCR)
-        for rel in doc.part.rels.values():
-            if "image" in rel.target_ref:
-                try:
-                    image_data = rel.target_part.blob
-                    temp_path = os.path.join(UPLOAD_DIR, "temp_docx_img.png")
-                    with open(temp_path, "wb") as img_file:
-                        img_file.write(image_data)
-
-                    ocr_result = multi_stage_ocr(temp_path, "image")
-                    ocr_text = ocr_result.get("text", "")
-                    if ocr_text.strip():
-                        text_chunks.append(f"OCR_IMAGE: {ocr_text.strip()}")
-
-                    os.remove(temp_path)
-                except Exception as e:
-                    print(f"⚠️ OCR image extraction failed: {e}")
+        # 3️⃣ Collect image OCR in document order
+        for future in ocr_futures:
+            try:
+                ocr_text = future.result()
+                if ocr_text.strip():
+                    text_chunks.append(f"OCR_IMAGE: {ocr_text.strip()}")
+            except Exception as e:
+                print(f"⚠️ OCR image extraction failed: {e}")
 
         print(f"✅ Extracted {len(text_chunks)} chunks from DOCX.")
     except Exception as e:
         print(f"❌ DOCX extraction error: {e}")
+    finally:
+        if ocr_pool is not None:
+            ocr_pool.shutdown(wait=True)
 
     return text_chunks
 
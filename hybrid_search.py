@@ -1,11 +1,22 @@
+import heapq
 import math
+import re
 import traceback
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any
 
+import numpy as np
+
 from services.vector_db import vector_search
 from services.bm25 import bm25
 from services.embeddings import embed_query
 from services.rerank import rerank_results
+from services.semcache import search_cache
+
+# Shared pool so the sparse and dense branches of a query overlap
+# (dense retrieval is network-bound: one Pinecone query)
+_RETRIEVAL_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hybrid")
 
 
 # ------------------------------------------------------------
@@ -16,36 +27,41 @@ def _normalize_scores(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     if not results:
         return results
 
-    scores = [r.get("score", 0) for r in results if isinstance(r.get("score"), (int, float))]
-    if not scores:
-        for r in results:
-            r["norm_score"] = 0.0
-        return results
-
-    min_s, max_s = min(scores), max(scores)
-    if max_s == min_s:
-        for r in results:
-            r["norm_score"] = 1.0
+    # One pass to pull scores out; non-numeric scores become NaN and normalize to 0
+    scores = np.array(
+        [s if isinstance(s, (int, float)) else np.nan for s in (r.get("score") for r in results)],
+        dtype=np.float64,
+    )
+    valid = ~np.isnan(scores)
+    if not valid.any():
+        norm = np.zeros(len(results))
     else:
-        for r in results:
-            r["norm_score"] = (r["score"] - min_s) / (max_s - min_s)
+        min_s, max_s = scores[valid].min(), scores[valid].max()
+        if max_s == min_s:
+            norm = np.ones(len(results))
+        else:
+            norm = np.where(valid, (scores - min_s) / (max_s - min_s), 0.0)
 
+    for r, n in zip(results, norm.tolist()):
+        r["norm_score"] = n
     return results
 
 
 # ------------------------------------------------------------
 # ✅ Query Classification (for dynamic weighting)
 # ------------------------------------------------------------
+_FACTOID_RE = re.compile(
+    r"\b(?:who|what|where|when|define|name|list|give|show|find|mention|which)\b",
+    re.IGNORECASE,
+)
+
+
 def _is_factoid_query(query: str) -> bool:
     """
     Lightweight heuristic to detect factoid vs semantic queries.
     Helps tune alpha for keyword-heavy vs reasoning-based questions.
     """
-    factoid_keywords = [
-        "who", "what", "where", "when", "define", "name",
-        "list", "give", "show", "find", "mention", "which"
-    ]
-    return any(k in query.lower() for k in factoid_keywords)
+    return _FACTOID_RE.search(query) is not None
 
 
 # ------------------------------------------------------------
@@ -62,10 +78,36 @@ def extract_text_from_vector_result(result: Dict[str, Any]) -> str:
     )
 
 
+# ------------------------------------------------------------
+# ✅ Retrieval Branches
+# ------------------------------------------------------------
+def _sparse_retrieve(query: str, top_k: int) -> List[Dict[str, Any]]:
+    """BM25 branch; returns [] on failure so the dense side still counts."""
+    try:
+        return _normalize_scores(bm25.retrieve(query, top_k=top_k))
+    except Exception as e:
+        print("⚠️ BM25 retrieval failed:", e)
+        return []
+
+
+def _dense_retrieve(query_emb, top_k: int) -> List[Dict[str, Any]]:
+    """Pinecone branch for an already-embedded query; returns [] on failure."""
+    try:
+        if query_emb is None:
+            print("⚠️ Vector embedding returned None.")
+            return []
+        return _normalize_scores(vector_search(query_emb, top_k=top_k))
+    except Exception as e:
+        print("⚠️ Vector retrieval failed:", e)
+        return []
+
+
 # ------------------------------------------------------------
 # ✅ Main Hybrid Search
 # ------------------------------------------------------------
-def hybrid_search(query: str, alpha: float = 0.5, top_k: int = 5) -> List[Dict[str, Any]]:
+def hybrid_search(
+    query: str, alpha: float = 0.5, top_k: int = 5, query_emb: List[float] = None
+) -> List[Dict[str, Any]]:
     """
     Hybrid Search Pipeline:
     Combines sparse (BM25) and dense (Pinecone vector) retrieval
@@ -73,6 +115,7 @@ def hybrid_search(query: str, alpha: float = 0.5, top_k: int = 5) -> List[Dict[s
     
     alpha: weight for dense similarity (0=BM25 only, 1=Vector only)
     top_k: number of final results to return
+    query_emb: embedding of `query` if the caller already has it
     """
     try:
         # 🧠 Dynamic Alpha — Adjust balance based on query type
@@ -83,61 +126,60 @@ def hybrid_search(query: str, alpha: float = 0.5, top_k: int = 5) -> List[Dict[s
 
         print(f"🔍 Running hybrid search: alpha={alpha}, top_k={top_k}")
 
-        # ----------------------------------------------------
-        # 1️⃣ Sparse Retrieval (BM25)
-        # ----------------------------------------------------
-        bm25_results = []
-        try:
-            bm25_results = bm25.retrieve(query, top_k=top_k)
-            bm25_results = _normalize_scores(bm25_results)
-        except Exception as e:
-            print("⚠️ BM25 retrieval failed:", e)
+        if query_emb is None:
+            try:
+                query_emb = embed_query(query)
+            except Exception as e:
+                print("⚠️ Query embedding failed:", e)
+
+        # ⚡ Paraphrases of a recent query reuse its final ranked results
+        # (checked before any retrieval work, so a hit costs no BM25 or Pinecone call)
+        cache_context = f"search:{alpha}:{top_k}"
+        cached = search_cache.lookup(query_emb, context=cache_context)
+        if cached is not None:
+            return list(cached)
 
         # ----------------------------------------------------
-        # 2️⃣ Dense Retrieval (Vector DB)
+        # 1️⃣ Dense (Pinecone) on the pool, Sparse (BM25) on this thread
         # ----------------------------------------------------
-        vector_results = []
-        try:
-            query_emb = embed_query(query)
-            if query_emb is not None:
-                vector_results = vector_search(query_emb, top_k=top_k)
-                vector_results = _normalize_scores(vector_results)
-            else:
-                print("⚠️ Vector embedding returned None.")
-        except Exception as e:
-            print("⚠️ Vector retrieval failed:", e)
+        dense_future = _RETRIEVAL_POOL.submit(_dense_retrieve, query_emb, top_k)
+        bm25_results = _sparse_retrieve(query, top_k)
+        vector_results = dense_future.result()
 
         # ----------------------------------------------------
-        # 3️⃣ Combine Scores
+        # 2️⃣ Combine Scores
         # ----------------------------------------------------
-        combined_scores = {}
+        combined_scores = defaultdict(float)
+        w_sparse, w_dense = 1 - alpha, alpha
         for doc in bm25_results:
             text = doc.get("text", "")
-            score = float(doc.get("norm_score", 0))
             if text:
-                combined_scores[text] = combined_scores.get(text, 0.0) + (1 - alpha) * score
+                combined_scores[text] += w_sparse * float(doc.get("norm_score", 0))
 
         for item in vector_results:
             text = extract_text_from_vector_result(item)
-            score = float(item.get("norm_score", 0))
             if text:
-                combined_scores[text] = combined_scores.get(text, 0.0) + alpha * score
+                combined_scores[text] += w_dense * float(item.get("norm_score", 0))
 
         if not combined_scores:
             print("⚠️ No combined results found.")
             return []
 
         # ----------------------------------------------------
-        # 4️⃣ Rank & Trim
+        # 3️⃣ Rank & Trim
         # ----------------------------------------------------
-        combined_list = [
-            {"text": t, "score": s} for t, s in combined_scores.items() if t.strip()
+        # Partial selection: O(N log k), same order (and tie order) as a full sort
+        top_results = [
+            {"text": t, "score": s}
+            for t, s in heapq.nlargest(
+                top_k,
+                ((t, s) for t, s in combined_scores.items() if t.strip()),
+                key=lambda kv: kv[1],
+            )
         ]
-        combined_list.sort(key=lambda x: x["score"], reverse=True)
-        top_results = combined_list[:top_k]
 
         # ----------------------------------------------------
-        # 5️⃣ Optional LLM Reranking
+        # 4️⃣ Optional LLM Reranking
         # ----------------------------------------------------
         try:
             print("🧠 Applying reranking for final refinement...")
@@ -149,6 +191,7 @@ def hybrid_search(query: str, alpha: float = 0.5, top_k: int = 5) -> List[Dict[s
         # ✅ Return Final Ranked Results
         # ----------------------------------------------------
         print(f"✅ Hybrid search complete. Returned {len(top_results)} results.")
+        search_cache.insert(query_emb, list(top_results), context=cache_context)
         return top_results
 
     except Exception as e:
@@ -1,6 +1,8 @@
 import os
+import asyncio
 import traceback
-from typing import List
+from functools import lru_cache
+from typing import List, AsyncIterator
 from dotenv import load_dotenv
 import google.generativeai as genai
 
@@ -17,20 +19,43 @@ genai.configure(api_key=GEN_API_KEY)
 GEN_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-pro")
 
 # Enable tracing for debugging
-TRACE_MODE = True  # ✅ set False to disable logging
+TRACE_MODE = os.getenv("LLM_TRACE_MODE", "false").lower() in ("1", "true", "yes")  # ✅ trace logs + answer trailer
+
+# Cap on concurrent async Gemini calls
+MAX_CONCURRENT_LLM = int(os.getenv("MAX_CONCURRENT_LLM", "8"))
+_LLM_SEMAPHORE = asyncio.Semaphore(MAX_CONCURRENT_LLM)
+
+
+class FailedAnswer(str):
+    """
+    Text returned in place of a model answer (missing key, no usable context,
+    Gemini error). Still a str for responses; callers must not cache it.
+    """
 
 
 # ------------------------------------------------------
 # ✅ Utility Functions
 # ------------------------------------------------------
+@lru_cache(maxsize=None)
+def get_model(name: str = GEN_MODEL) -> "genai.GenerativeModel":
+    """Shared GenerativeModel per model name (built once, reused by every call)."""
+    return genai.GenerativeModel(name)
+
+
 def _safe_context_join(chunks: List[str], max_chars: int = 3500) -> str:
     """Join context chunks within a safe length limit."""
-    context = ""
+    parts = []
+    used = 0  # length of the joined string so far
     for chunk in chunks:
-        if len(context) + len(chunk) > max_chars:
+        if used + len(chunk) > max_chars:
             break
-        context += ("\n\n" if context else "") + chunk
-    return context
+        if used:
+            used += 2 + len(chunk)  # "\n\n" separator + chunk
+            parts.append(chunk)
+        else:
+            parts = [chunk]  # nothing non-empty yet: no leading separators
+            used = len(chunk)
+    return "\n\n".join(parts)
 
 
 def _build_prompt(context: str, question: str) -> str:
@@ -64,6 +89,55 @@ def score_relevance(query: str, text: str) -> float:
     return len(q.intersection(t)) / (len(q) + 1)
 
 
+def _extract_response_text(response, trace_info: dict) -> str:
+    """Pull the answer text out of any Gemini response shape."""
+    # ✅ 1️⃣ New SDK format (simple text)
+    if hasattr(response, "text") and response.text:
+        trace_info["format_used"] = "text"
+        return response.text.strip()
+
+    # ✅ 2️⃣ Structured candidates format
+    if hasattr(response, "candidates") and response.candidates:
+        trace_info["format_used"] = "candidates"
+        cand = response.candidates[0]
+        parts = getattr(cand.content, "parts", [])
+        if parts and hasattr(parts[0], "text"):
+            return parts[0].text.strip()
+        return FailedAnswer("⚠️ Empty candidate parts returned.")
+
+    # ✅ 3️⃣ Dict-style fallback (legacy or REST-like)
+    if isinstance(response, dict):
+        trace_info["format_used"] = "dict"
+        return (
+            response.get("text")
+            or response.get("output")
+            or response.get("candidates", [{}])[0]
+            .get("content", {})
+            .get("parts", [{}])[0]
+            .get("text", "")
+        ).strip()
+
+    trace_info["format_used"] = "unknown"
+    return FailedAnswer("⚠️ Model produced no readable output.")
+
+
+def _finish_answer(final_text: str, trace_info: dict) -> str:
+    """Trace logging + trailer shared by the sync and async entry points."""
+    if not TRACE_MODE:
+        return final_text
+
+    # ✅ Optional trace logging
+    print("\n--- Gemini Trace Info ---")
+    print(f"→ Format Used : {trace_info['format_used']}")
+    if trace_info["error"]:
+        print(f"→ Error : {trace_info['error']}")
+    print("--------------------------\n")
+
+    # ✅ Append trace info to the answer for debugging (kept out of stored history otherwise)
+    traced = f"{final_text}\n\n[Trace: format={trace_info['format_used']}]"
+    return FailedAnswer(traced) if isinstance(final_text, FailedAnswer) else traced
+
+
 # ------------------------------------------------------
 # ✅ Main Function — with TRACE MODE
 # ------------------------------------------------------
@@ -73,64 +147,94 @@ def generate_answer(chunks: List[str], question: str, max_context_chars: int = 3
     Includes robust fallbacks and trace mode.
     """
     if not GEN_API_KEY:
-        return "⚠️ Gemini API key missing"
+        return FailedAnswer("⚠️ Gemini API key missing")
 
     context = _safe_context_join(chunks, max_chars=max_context_chars)
     if not context.strip():
-        return "I can't find that information in the provided documents."
+        return FailedAnswer("I can't find that information in the provided documents.")
 
     prompt = _build_prompt(context, question)
 
     trace_info = {"format_used": None, "error": None}
 
     try:
-        model = genai.GenerativeModel(GEN_MODEL)
+        model = get_model(GEN_MODEL)
         response = model.generate_content(prompt)
+        final_text = _extract_response_text(response, trace_info)
 
-        # ✅ 1️⃣ New SDK format (simple text)
-        if hasattr(response, "text") and response.text:
-            trace_info["format_used"] = "text"
-            final_text = response.text.strip()
-
-        # ✅ 2️⃣ Structured candidates format
-        elif hasattr(response, "candidates") and response.candidates:
-            trace_info["format_used"] = "candidates"
-            cand = response.candidates[0]
-            parts = getattr(cand.content, "parts", [])
-            if parts and hasattr(parts[0], "text"):
-                final_text = parts[0].text.strip()
-            else:
-                final_text = "⚠️ Empty candidate parts returned."
-
-        # ✅ 3️⃣ Dict-style fallback (legacy or REST-like)
-        elif isinstance(response, dict):
-            trace_info["format_used"] = "dict"
-            final_text = (
-                response.get("text")
-                or response.get("output")
-                or response.get("candidates", [{}])[0]
-                .get("content", {})
-                .get("parts", [{}])[0]
-                .get("text", "")
-            ).strip()
+    except Exception as e:
+        trace_info["error"] = str(e)
+        print("\n🔥 Gemini error in generate_answer() 🔥")
+        traceback.print_exc()
+        final_text = FailedAnswer(f"⚠️ Model error: {str(e)}")
 
-        else:
-            trace_info["format_used"] = "unknown"
-            final_text = "⚠️ Model produced no readable output."
+    return _finish_answer(final_text, trace_info)
+
+
+async def agenerate_answer(chunks: List[str], question: str, max_context_chars: int = 3500) -> str:
+    """
+    Async variant of generate_answer() for concurrent LLM calls.
+    In-flight requests are capped by MAX_CONCURRENT_LLM.
+    """
+    if not GEN_API_KEY:
+        return FailedAnswer("⚠️ Gemini API key missing")
+
+    context = _safe_context_join(chunks, max_chars=max_context_chars)
+    if not context.strip():
+        return FailedAnswer("I can't find that information in the provided documents.")
+
+    prompt = _build_prompt(context, question)
+
+    trace_info = {"format_used": None, "error": None}
+
+    try:
+        model = get_model(GEN_MODEL)
+        async with _LLM_SEMAPHORE:
+            response = await model.generate_content_async(prompt)
+        final_text = _extract_response_text(response, trace_info)
 
     except Exception as e:
         trace_info["error"] = str(e)
-        print("\n🔥 Gemini error in generate_answer() 🔥")
+        print("\n🔥 Gemini error in agenerate_answer() 🔥")
         traceback.print_exc()
-        final_text = f"⚠️ Model error: {str(e)}"
+        final_text = FailedAnswer(f"⚠️ Model error: {str(e)}")
 
-    # ✅ Optional trace logging
-    if TRACE_MODE:
-        print("\n--- Gemini Trace Info ---")
-        print(f"→ Format Used : {trace_info['format_used']}")
-        if trace_info["error"]:
-            print(f"→ Error : {trace_info['error']}")
-        print("--------------------------\n")
-
-    # ✅ Append trace info to the answer for debugging
-    return f"{final_text}\n\n[Trace: format={trace_info['format_used']}]"
+    return _finish_answer(final_text, trace_info)
+
+
+async def astream_answer(chunks: List[str], question: str, max_context_chars: int = 3500) -> AsyncIterator[str]:
+    """
+    Streaming variant of agenerate_answer(): yields answer text as Gemini
+    produces it, followed by the same trace trailer.
+    """
+    if not GEN_API_KEY:
+        yield FailedAnswer("⚠️ Gemini API key missing")
+        return
+
+    context = _safe_context_join(chunks, max_chars=max_context_chars)
+    if not context.strip():
+        yield FailedAnswer("I can't find that information in the provided documents.")
+        return
+
+    prompt = _build_prompt(context, question)
+
+    trace_info = {"format_used": "stream", "error": None}
+
+    try:
+        model = get_model(GEN_MODEL)
+        async with _LLM_SEMAPHORE:
+            response = await model.generate_content_async(prompt, stream=True)
+            async for chunk in response:
+                text = getattr(chunk, "text", "")
+                if text:
+                    yield text
+
+    except Exception as e:
+        trace_info["error"] = str(e)
+        print("\n🔥 Gemini error in astream_answer() 🔥")
+        traceback.print_exc()
+        yield FailedAnswer(f"⚠️ Model error: {str(e)}")
+
+    trailer = _finish_answer("", trace_info)
+    if trailer:
+        yield trailer
@@ -1,9 +1,16 @@
 import redis
 import json
 import os
-from datetime import datetime
+from services.timeutils import now_iso
 from dotenv import load_dotenv
 
+# --- orjson (optional, much faster than stdlib json) ---
+try:
+    import orjson
+    _ORJSON_ENABLED = True
+except Exception:
+    _ORJSON_ENABLED = False
+
 # -------------------------------------------------------------
 # ✅ Load Config
 # -------------------------------------------------------------
@@ -13,6 +20,7 @@ REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
 REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
 REDIS_DB = 1  # dedicated DB for chat memory
 CHAT_TTL = 3600 * 3  # 3 hours default
+MAX_TURNS = int(os.getenv("CHAT_MAX_TURNS", "100"))  # records kept per session
 
 # -------------------------------------------------------------
 # ✅ Initialize Redis Client for Memory
@@ -44,36 +52,88 @@ def _key(session_id: str) -> str:
 # -------------------------------------------------------------
 # ✅ Core Memory Functions
 # -------------------------------------------------------------
+def _dumps(record) -> str:
+    if _ORJSON_ENABLED:
+        try:
+            return orjson.dumps(record).decode()
+        except Exception:
+            pass  # e.g. lone surrogates — let stdlib json escape them
+    return json.dumps(record)
+
+
+def _loads(data):
+    if _ORJSON_ENABLED:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass  # stdlib-escaped lone surrogates are rejected by orjson
+    return json.loads(data)
+
+
+def _is_wrongtype(e: Exception) -> bool:
+    return isinstance(e, redis.exceptions.ResponseError) and "WRONGTYPE" in str(e)
+
+
+def _migrate_legacy(key: str):
+    """Convert a pre-list session (one JSON array string) into a Redis list."""
+    data = redis_client.get(key)
+    records = _loads(data) if data else []
+    pipe = redis_client.pipeline()
+    pipe.delete(key)
+    if records:
+        pipe.rpush(key, *[_dumps(r) for r in records])
+        pipe.expire(key, CHAT_TTL)
+    pipe.execute()
+
+
+def _append_record(key: str, record: dict) -> int:
+    """RPUSH + LTRIM + EXPIRE in one round trip; returns the list length before trimming."""
+    pipe = redis_client.pipeline()
+    pipe.rpush(key, _dumps(record))
+    pipe.ltrim(key, -MAX_TURNS, -1)
+    pipe.expire(key, CHAT_TTL)
+    return pipe.execute()[0]
+
+
 def get_memory(session_id: str):
     """Retrieve conversation memory for a session."""
     if not redis_client:
         return []
     try:
-        data = redis_client.get(_key(session_id))
-        if not data:
-            return []
-        return json.loads(data)
+        key = _key(session_id)
+        try:
+            items = redis_client.lrange(key, 0, -1)
+        except redis.exceptions.ResponseError as e:
+            if not _is_wrongtype(e):
+                raise
+            data = redis_client.get(key)  # legacy JSON-array session
+            return _loads(data) if data else []
+        return [_loads(x) for x in items]
     except Exception as e:
         print(f"⚠️ Redis memory read error: {e}")
         return []
 
 
 def add_to_memory(session_id: str, role: str, content: str):
-    """Add a user or assistant message to memory."""
+    """Add a user or assistant message to memory (O(1) append, no history reload)."""
     if not redis_client:
         return
     try:
         record = {
             "role": role,
             "content": content,
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": now_iso(),
         }
 
-        history = get_memory(session_id)
-        history.append(record)
-
-        redis_client.setex(_key(session_id), CHAT_TTL, json.dumps(history))
-        print(f"💬 Memory updated for session '{session_id}' ({len(history)} turns).")
+        key = _key(session_id)
+        try:
+            turns = _append_record(key, record)
+        except redis.exceptions.ResponseError as e:
+            if not _is_wrongtype(e):
+                raise
+            _migrate_legacy(key)
+            turns = _append_record(key, record)
+        print(f"💬 Memory updated for session '{session_id}' ({min(turns, MAX_TURNS)} turns).")
     except Exception as e:
         print(f"❌ Redis memory write error: {e}")
 
@@ -101,9 +161,18 @@ def summarize_if_needed(session_id: str, summarize_func, threshold: int = 10):
     if not redis_client:
         return None
     try:
-        history = get_memory(session_id)
-        if len(history) > threshold:
-            print(f"🧠 Auto-summarizing session '{session_id}' ({len(history)} messages)...")
+        key = _key(session_id)
+        try:
+            turns = redis_client.llen(key)
+        except redis.exceptions.ResponseError as e:
+            if not _is_wrongtype(e):
+                raise
+            _migrate_legacy(key)
+            turns = redis_client.llen(key)
+
+        if turns > threshold:
+            print(f"🧠 Auto-summarizing session '{session_id}' ({turns} messages)...")
+            history = [_loads(x) for x in redis_client.lrange(key, -threshold, -1)]
 
             text_to_summarize = "\n".join(
                 [f"{m['role'].upper()}: {m['content']}" for m in history[-threshold:]]
@@ -0,0 +1,64 @@
+import time
+from contextlib import contextmanager
+
+# --- Prometheus (optional) ---
+try:
+    from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+    _PROMETHEUS_ENABLED = True
+except Exception as e:
+    print("⚠️ prometheus_client not available — metrics disabled:", e)
+    _PROMETHEUS_ENABLED = False
+    CONTENT_TYPE_LATEST = "text/plain; charset=utf-8"
+
+
+# ------------------------------------------------------------
+# ✅ Pinecone admin metrics
+# ------------------------------------------------------------
+if _PROMETHEUS_ENABLED:
+    PINECONE_DELETES = Counter(
+        "pinecone_deletes_total", "delete_source calls (one per call)", ["namespace", "status"]
+    )
+    PINECONE_DELETE_IDS = Counter(
+        "pinecone_delete_ids_total",
+        "Vector IDs sent in delete_source batches (filter deletes are not counted)",
+        ["namespace", "result"],
+    )
+    PINECONE_DELETE_SECONDS = Histogram(
+        "pinecone_delete_seconds", "delete_source wall time", ["namespace"]
+    )
+    PINECONE_STATS_CALLS = Counter(
+        "pinecone_stats_calls_total", "describe_namespace calls", ["namespace", "status"]
+    )
+
+
+@contextmanager
+def delete_timer(namespace: str):
+    """Observe delete_source latency for a namespace."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if _PROMETHEUS_ENABLED:
+            PINECONE_DELETE_SECONDS.labels(namespace).observe(time.perf_counter() - start)
+
+
+def record_delete(namespace: str, status: str, deleted: int = 0, failed: int = 0):
+    """One delete_source call. status: ok | empty | err | filter; deleted/failed count IDs."""
+    if not _PROMETHEUS_ENABLED:
+        return
+    PINECONE_DELETES.labels(namespace, status).inc()
+    if deleted:
+        PINECONE_DELETE_IDS.labels(namespace, "deleted").inc(deleted)
+    if failed:
+        PINECONE_DELETE_IDS.labels(namespace, "failed").inc(failed)
+
+
+def record_stats_call(namespace: str, status: str):
+    """status: ok | err."""
+    if _PROMETHEUS_ENABLED:
+        PINECONE_STATS_CALLS.labels(namespace, status).inc()
+
+
+def render_latest() -> bytes:
+    """Prometheus text exposition of every registered metric."""
+    return generate_latest() if _PROMETHEUS_ENABLED else b""
@@ -1,12 +1,18 @@
 import os
 import io
+import hashlib
+import queue
+import tempfile
+import threading
 import traceback
-from datetime import datetime
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from services.timeutils import now_iso
+from services.cache import get_cached_ocr_result, cache_ocr_result
 
 from PIL import Image
 import numpy as np
 import pytesseract
-import easyocr
 import pdfplumber
 from pdf2image import convert_from_path
 import docx2txt 
@@ -14,41 +20,201 @@ from dotenv import load_dotenv
 load_dotenv()
 
 
-# --- Google Cloud Vision ---
+# --- Google Cloud Vision (client created on first use) ---
 try:
     from google.cloud import vision
-    vision_client = vision.ImageAnnotatorClient()
     _VISION_ENABLED = True
 except Exception as e:
     print("⚠️ Google Vision not configured:", e)
     _VISION_ENABLED = False
 
-# --- Gemini Vision ---
+# --- Gemini Vision (model instances shared with services.llm) ---
 try:
     import google.generativeai as genai
     genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+    from services.llm import get_model
     _GENAI_ENABLED = True
 except Exception:
     _GENAI_ENABLED = False
 
-# --- Initialize EasyOCR ---
-EASY_OCR_READER = easyocr.Reader(['en'], gpu=False)
+GEMINI_VISION_MODEL = "gemini-1.5-flash-latest"
+
+# --- tesserocr: in-process libtesseract (optional; no fork/exec or temp files per image) ---
+try:
+    from tesserocr import PyTessBaseAPI
+    _TESSEROCR_ENABLED = True
+except Exception:
+    _TESSEROCR_ENABLED = False
+
+# --- libjpeg-turbo JPEG decoder (optional, SIMD-accelerated) ---
+try:
+    from turbojpeg import TurboJPEG, TJPF_RGB
+    _TURBOJPEG = TurboJPEG()
+except Exception as e:
+    print("ℹ️ libjpeg-turbo not available — using Pillow's JPEG decoder:", e)
+    _TURBOJPEG = None
+
+# --- Rasterization / encoding settings ---
+OCR_DPI = int(os.getenv("OCR_DPI", "150"))  # first-pass render; body text OCRs fine at 150
+OCR_RETRY_DPI = int(os.getenv("OCR_RETRY_DPI", "300"))  # re-render when the first pass finds ~nothing
+OCR_MAX_SIDE = int(os.getenv("OCR_MAX_SIDE", "1600"))  # local OCR cost grows with pixel count
+OCR_API_MAX_SIDE = int(os.getenv("OCR_API_MAX_SIDE", "2000"))  # long-side cap for Vision/Gemini uploads
+OCR_RENDER_THREADS = int(os.getenv("OCR_RENDER_THREADS", "4"))  # parallel pdftoppm processes
+# Below either threshold (blurry / low-contrast input) Tesseract rarely succeeds
+OCR_BLUR_VAR_MIN = float(os.getenv("OCR_BLUR_VAR_MIN", "80"))
+OCR_CONTRAST_STD_MIN = float(os.getenv("OCR_CONTRAST_STD_MIN", "25"))
+OCR_BLANK_STD_MAX = float(os.getenv("OCR_BLANK_STD_MAX", "5"))  # grey-level std of an empty scan page
+# Page OCR is mostly waiting on Vision/Gemini round trips, so allow more threads than cores
+OCR_PARALLEL = int(os.getenv("OCR_PARALLEL", str(max(8, os.cpu_count() or 1))))
+OCR_PAGE_CACHE_SIZE = int(os.getenv("OCR_PAGE_CACHE_SIZE", "512"))  # in-process (text, engine) LRU
+# Vision / Gemini payloads: JPEG encodes ~10× faster than PNG and uploads 5–10× fewer bytes
+OCR_JPEG_QUALITY = int(os.getenv("OCR_JPEG_QUALITY", "85"))
+_API_IMAGE_KW = {"format": "JPEG", "quality": OCR_JPEG_QUALITY, "optimize": False}
+
+# --- Lazily initialized clients (model weights / network auth only when needed) ---
+_CLIENT_LOCK = threading.Lock()
+_vision_client = None
+_easy_ocr_reader = None
+
+
+def _get_vision_client():
+    """Create the Vision client on first use; disables the stage if that fails."""
+    global _vision_client, _VISION_ENABLED
+    if _vision_client is None and _VISION_ENABLED:
+        with _CLIENT_LOCK:
+            if _vision_client is None and _VISION_ENABLED:
+                creds_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
+                if not creds_path or not os.path.exists(creds_path):
+                    print(f"❌ [Vision] GOOGLE_APPLICATION_CREDENTIALS not found or invalid: {creds_path}")
+                    _VISION_ENABLED = False
+                    return None
+                try:
+                    _vision_client = vision.ImageAnnotatorClient()
+                except Exception as e:
+                    print("⚠️ Google Vision not configured:", e)
+                    _VISION_ENABLED = False
+    return _vision_client
+
+
+_TESS_APIS = queue.SimpleQueue()  # idle PyTessBaseAPI instances (one per concurrent page at most)
+
+
+def _tesseract_text(image) -> str:
+    """Tesseract via a pooled in-process tesserocr API, else the pytesseract CLI wrapper."""
+    if not _TESSEROCR_ENABLED:
+        return pytesseract.image_to_string(image)
+    try:
+        api = _TESS_APIS.get_nowait()
+    except queue.Empty:
+        api = PyTessBaseAPI(lang="eng")
+    try:
+        api.SetImage(image)
+        return api.GetUTF8Text()
+    finally:
+        api.Clear()
+        _TESS_APIS.put(api)
+
+
+def _easy_reader():
+    """Load EasyOCR (torch + ~100 MB of weights) the first time a page needs it."""
+    global _easy_ocr_reader
+    if _easy_ocr_reader is None:
+        with _CLIENT_LOCK:
+            if _easy_ocr_reader is None:
+                import easyocr
+                use_gpu = _easyocr_use_gpu()
+                print(f"⏳ Loading EasyOCR model ({'GPU' if use_gpu else 'CPU, int8'})...")
+                # quantize: dynamic int8 weights on CPU (ignored on GPU)
+                _easy_ocr_reader = easyocr.Reader(['en'], gpu=use_gpu, quantize=True)
+    return _easy_ocr_reader
+
+
+def _easyocr_use_gpu() -> bool:
+    """EASYOCR_GPU=auto|true|false; auto uses CUDA when torch can see a device."""
+    mode = os.getenv("EASYOCR_GPU", "auto").lower()
+    if mode in ("0", "false", "no"):
+        return False
+    try:
+        import torch
+        available = torch.cuda.is_available()
+    except Exception:
+        available = False
+    if mode in ("1", "true", "yes") and not available:
+        print("⚠️ EASYOCR_GPU requested but CUDA is unavailable — using CPU.")
+    return available
 
 
 # ==========================================================
 # ✅ Helper: Convert file or UploadFile → PIL.Image
 # ==========================================================
+_JPEG_MAGIC = b"\xff\xd8\xff"
+
+
+def _open_image_bytes(data):
+    """Decode image bytes, using libjpeg-turbo for JPEGs when available."""
+    if _TURBOJPEG is not None and data[:3] == _JPEG_MAGIC:
+        try:
+            return Image.fromarray(_TURBOJPEG.decode(data, pixel_format=TJPF_RGB))
+        except Exception as e:
+            print("⚠️ libjpeg-turbo decode failed, falling back to Pillow:", e)
+    return Image.open(io.BytesIO(data))
+
+
+def _encode_for_api(image) -> bytes:
+    """Encode an RGB PIL image once for the cloud OCR engines."""
+    buf = io.BytesIO()
+    image.save(buf, **_API_IMAGE_KW)
+    return buf.getvalue()
+
+
+def _right_size(image, max_side=OCR_MAX_SIDE):
+    """Downscale so the long side is at most max_side px (None/0 = keep as is)."""
+    w, h = image.size
+    m = max(w, h)
+    if not max_side or m <= max_side:
+        return image
+    scale = max_side / m
+    return image.resize((max(1, int(w * scale)), max(1, int(h * scale))), Image.LANCZOS)
+
+
+def _needs_neural_ocr(image) -> bool:
+    """
+    Cheap pre-check: variance of the Laplacian (sharpness) and grey-level std
+    (contrast). Blurry or washed-out inputs go straight to EasyOCR / Gemini.
+    """
+    try:
+        a = np.asarray(image.convert("L"), dtype=np.float32)
+        if a.shape[0] < 3 or a.shape[1] < 3:
+            return False
+        lap = a[1:-1, :-2] + a[1:-1, 2:] + a[:-2, 1:-1] + a[2:, 1:-1] - 4.0 * a[1:-1, 1:-1]
+        return float(lap.var()) < OCR_BLUR_VAR_MIN or float(a.std()) < OCR_CONTRAST_STD_MIN
+    except Exception:
+        return False
+
+
 def _pil_from_filelike(file_like):
     if hasattr(file_like, "file"):  # FastAPI UploadFile
-        data = file_like.file.read()
+        stream = file_like.file
         try:
-            file_like.file.seek(0)
-        except Exception:
-            pass
-        return Image.open(io.BytesIO(data))
+            if _TURBOJPEG is not None and stream.read(3) == _JPEG_MAGIC:
+                stream.seek(0)
+                return _open_image_bytes(stream.read())  # libjpeg-turbo needs the bytes
+            stream.seek(0)
+            # Decode straight from the spooled file: no second in-memory copy of the upload
+            image = Image.open(stream)
+            image.load()
+            return image
+        finally:
+            try:
+                stream.seek(0)
+            except Exception:
+                pass
     if isinstance(file_like, (bytes, bytearray)):
-        return Image.open(io.BytesIO(file_like))
+        return _open_image_bytes(file_like)
     if isinstance(file_like, str) and os.path.exists(file_like):
+        if _TURBOJPEG is not None and file_like.lower().endswith((".jpg", ".jpeg")):
+            with open(file_like, "rb") as f:
+                return _open_image_bytes(f.read())
         return Image.open(file_like)
     if isinstance(file_like, Image.Image):
         return file_like
@@ -58,35 +224,33 @@ def _pil_from_filelike(file_like):
 # ==========================================================
 # ✅ OCR 1: Google Cloud Vision (Primary)
 # ==========================================================
-def extract_with_google_vision(image):
+def extract_with_google_vision(image, content: bytes = None):
     """
     Extract text from a PIL.Image using Google Cloud Vision API.
     Handles credentials, empty returns, and detailed error logging.
+    content: already-encoded JPEG bytes of `image`, if the caller has them.
     """
     if not _VISION_ENABLED:
         print("⚠️ [Vision] Google Vision disabled or not initialized.")
         return ""
 
     try:
-        # --- Ensure credentials exist ---
-        creds_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
-        if not creds_path or not os.path.exists(creds_path):
-            print(f"❌ [Vision] GOOGLE_APPLICATION_CREDENTIALS not found or invalid: {creds_path}")
+        # --- Shared client (credentials validated once, on first use) ---
+        client = _get_vision_client()
+        if client is None:
             return ""
-        os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = creds_path
 
         # --- Prepare image bytes ---
-        if image.mode != "RGB":
-            image = image.convert("RGB")
-        img_byte_arr = io.BytesIO()
-        image.save(img_byte_arr, format='PNG')
-        content = img_byte_arr.getvalue()
+        if content is None:
+            if image.mode != "RGB":
+                image = image.convert("RGB")
+            content = _encode_for_api(image)
 
         # --- Log start ---
         print("🚀 [Vision] Calling Google Cloud Vision API...")
 
         # --- Perform OCR ---
-        response = vision_client.document_text_detection(image=vision.Image(content=content))
+        response = client.document_text_detection(image=vision.Image(content=content))
 
         # --- Check API error ---
         if response.error.message:
@@ -117,20 +281,20 @@ def extract_with_google_vision(image):
 # ==========================================================
 # ✅ OCR 2: Gemini Vision Fallback
 # ==========================================================
-def extract_with_gemini_vision(image):
+def extract_with_gemini_vision(image, content: bytes = None):
     """
     Fallback OCR using Gemini Vision API.
+    content: already-encoded JPEG bytes of `image`, if the caller has them.
     """
     if not _GENAI_ENABLED:
         return ""
     try:
-        buf = io.BytesIO()
-        image.save(buf, format="PNG")
-        content = buf.getvalue()
-        model = genai.GenerativeModel("gemini-1.5-flash-latest")
+        if content is None:
+            content = _encode_for_api(image.convert("RGB") if image.mode != "RGB" else image)
+        model = get_model(GEMINI_VISION_MODEL)
         response = model.generate_content([
             "Extract all readable text and tables from this image.",
-            content
+            {"mime_type": "image/jpeg", "data": content}
         ])
         if hasattr(response, "text") and response.text:
             return response.text.strip()
@@ -148,30 +312,104 @@ def extract_with_gemini_vision(image):
 # ==========================================================
 # ✅ OCR 3: Table Extraction from PDFs
 # ==========================================================
+def _page_tables_markdown(page, page_num: int):
+    """Format one pdfplumber page's tables as Markdown-like text blocks."""
+    markdown_tables = []
+    for t_index, table in enumerate(page.extract_tables() or []):
+        if not table:
+            continue
+        md = f"\n📊 **Table (Page {page_num}, Table {t_index+1})**\n\n"
+        for row in table:
+            cleaned = [cell if cell else "" for cell in row]
+            md += " | ".join(cleaned) + "\n"
+        markdown_tables.append(md.strip())
+    return markdown_tables
+
+
 def extract_tables_from_pdf(pdf_path):
     """Extract tables from PDF and format as Markdown-like text."""
     markdown_tables = []
     try:
         with pdfplumber.open(pdf_path) as pdf:
             for page_num, page in enumerate(pdf.pages, start=1):
-                tables = page.extract_tables() or []
-                for t_index, table in enumerate(tables):
-                    if not table:
-                        continue
-                    md = f"\n📊 **Table (Page {page_num}, Table {t_index+1})**\n\n"
-                    for row in table:
-                        cleaned = [cell if cell else "" for cell in row]
-                        md += " | ".join(cleaned) + "\n"
-                    markdown_tables.append(md.strip())
+                markdown_tables.extend(_page_tables_markdown(page, page_num))
     except Exception as e:
         print("⚠️ Table extraction failed:", e)
     return markdown_tables
 
 
+def _extract_pdf_text_and_tables(pdf_path):
+    """
+    Single pdfplumber pass collecting page text and tables together, so each
+    page's layout is parsed once instead of once per extraction.
+    Returns (text, tables, text_len); text_len counts non-blank characters
+    so the scanned-PDF check needs no extra join of the document.
+    """
+    buf, tables = io.StringIO(), []
+    text_len = 0
+    table_errors = 0
+    with pdfplumber.open(pdf_path) as pdf:
+        for page_num, page in enumerate(pdf.pages, start=1):
+            text = page.extract_text(layout=True) or ""
+            stripped_len = len(text.strip())
+            if stripped_len:
+                if text_len:
+                    buf.write("\n")
+                buf.write(text)
+                text_len += stripped_len
+            try:
+                tables.extend(_page_tables_markdown(page, page_num))
+            except Exception as e:
+                table_errors += 1
+                if table_errors == 1:
+                    print("⚠️ Table extraction failed:", e)
+            page.flush_cache()  # drop this page's parsed objects before the next one
+    return buf.getvalue().strip(), tables, text_len
+
+
+# ==========================================================
+# ✅ Content-Hash OCR Cache (in-process LRU → Redis)
+# ==========================================================
+_PAGE_CACHE = OrderedDict()  # pixel hash -> (text, engine), LRU order
+_PAGE_CACHE_LOCK = threading.Lock()
+
+
+def _image_hash(image, max_side) -> str:
+    """BLAKE2b over the decoded pixels, so re-encoded copies of a page still match."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{image.mode}:{image.size}:{max_side}".encode())
+    h.update(image.tobytes())
+    return h.hexdigest()
+
+
+def _page_cache_get(key: str):
+    with _PAGE_CACHE_LOCK:
+        hit = _PAGE_CACHE.get(key)
+        if hit is not None:
+            _PAGE_CACHE.move_to_end(key)
+            return hit
+    cached = get_cached_ocr_result(key, "page")
+    if cached and cached.get("text"):
+        hit = (cached["text"], cached.get("engine"))
+        _page_cache_put(key, hit, persist=False)
+        return hit
+    return None
+
+
+def _page_cache_put(key: str, value, persist: bool = True):
+    with _PAGE_CACHE_LOCK:
+        _PAGE_CACHE[key] = value
+        _PAGE_CACHE.move_to_end(key)
+        while len(_PAGE_CACHE) > OCR_PAGE_CACHE_SIZE:
+            _PAGE_CACHE.popitem(last=False)
+    if persist:
+        cache_ocr_result(key, "page", {"text": value[0], "engine": value[1]})
+
+
 # ==========================================================
 # ✅ Unified Image OCR (Multi-Stage)
 # ==========================================================
-def extract_text_from_image(file):
+def extract_text_from_image(file, max_side=OCR_MAX_SIDE):
     """
     Extract text from an image using prioritized OCR engines:
     Priority:
@@ -179,35 +417,65 @@ def extract_text_from_image(file):
     2️⃣ Tesseract
     3️⃣ EasyOCR
     4️⃣ Gemini Vision
+    max_side: long-side cap applied before the local engines (Tesseract, EasyOCR)
+    Results are cached by pixel hash; only successful reads are stored, so
+    transient API failures are retried next time.
     """
 
     image = _pil_from_filelike(file)
     if image.mode != "RGB":
         image = image.convert("RGB")
+    return _extract_rgb_cached(image, max_side, _image_hash(image, max_side))
+
+
+def _extract_rgb_cached(image, max_side, key: str):
+    """Cache lookup → engine chain → cache store, for an RGB image and its pixel hash."""
+    hit = _page_cache_get(key)
+    if hit is not None:
+        return hit
+
+    text, engine = _run_ocr_stages(image, max_side)
+    if engine != "None":
+        _page_cache_put(key, (text, engine))
+    return text, engine
+
 
+def _run_ocr_stages(image, max_side):
+    """The uncached Vision → Tesseract → EasyOCR → Gemini chain for an RGB image."""
     text, engine = "", None
+    payload = None  # JPEG bytes, encoded once and shared by Vision and Gemini
+
+    # Upload size cap; skipped on full-resolution retries (max_side=None)
+    api_image = _right_size(image, OCR_API_MAX_SIDE if max_side else None)
 
     # --- Stage 1: Google Vision (primary) ---
     if _VISION_ENABLED:
-        text = extract_with_google_vision(image)
+        payload = _encode_for_api(api_image)
+        text = extract_with_google_vision(api_image, content=payload)
         if text and len(text.strip()) > 3:
             print("✅ Google Vision OCR succeeded.")
             return text.strip(), "Google Vision API"
         else:
             print("⚠️ Google Vision returned too little text. Falling back...")
 
-    # --- Stage 2: Tesseract ---
-    try:
-        tesseract_text = pytesseract.image_to_string(image).strip()
-        if tesseract_text and len(tesseract_text) > 3:
-            print("✅ Tesseract OCR succeeded.")
-            return tesseract_text, "Tesseract"
-    except Exception as e:
-        print("⚠️ Tesseract failed:", e)
+    local_image = _right_size(image, max_side)
+
+    # --- Stage 2: Tesseract (skipped for blurry / low-contrast input) ---
+    if _needs_neural_ocr(local_image):
+        print("ℹ️ Low sharpness/contrast — skipping Tesseract.")
+    else:
+        try:
+            tesseract_text = _tesseract_text(local_image).strip()
+            if tesseract_text and len(tesseract_text) > 3:
+                print("✅ Tesseract OCR succeeded.")
+                return tesseract_text, "Tesseract"
+        except Exception as e:
+            print("⚠️ Tesseract failed:", e)
 
     # --- Stage 3: EasyOCR ---
     try:
-        easy_text = "\n".join(EASY_OCR_READER.readtext(np.array(image), detail=0)).strip()
+        # asarray wraps PIL's buffer instead of np.array's extra copy; image is already RGB
+        easy_text = "\n".join(_easy_reader().readtext(np.asarray(local_image), detail=0)).strip()
         if easy_text and len(easy_text) > 3:
             print("✅ EasyOCR succeeded.")
             return easy_text, "EasyOCR"
@@ -217,7 +485,7 @@ def extract_text_from_image(file):
     # --- Stage 4: Gemini Vision ---
     if _GENAI_ENABLED:
         try:
-            gemini_text = extract_with_gemini_vision(image)
+            gemini_text = extract_with_gemini_vision(api_image, content=payload)
             if gemini_text and len(gemini_text) > 3:
                 print("✅ Gemini Vision OCR succeeded.")
                 return gemini_text.strip(), "Gemini Vision"
@@ -226,6 +494,64 @@ def extract_text_from_image(file):
 
     return "No readable text found", "None"
 
+def _is_blank_page(image) -> bool:
+    """Near-uniform page (blank scan / separator sheet): nothing worth OCR'ing."""
+    try:
+        return float(np.asarray(image.convert("L")).std()) < OCR_BLANK_STD_MAX
+    except Exception:
+        return False
+
+
+def _ocr_page_file(page_path: str, max_side=OCR_MAX_SIDE, seen: dict = None, seen_lock=None):
+    """
+    OCR one rendered page from disk, holding only that page in memory.
+    `seen` (pixel hash -> Future) lets identical pages of one document share
+    a single OCR run, even while the first copy is still in flight.
+    """
+    with Image.open(page_path) as img:
+        image = img if img.mode == "RGB" else img.convert("RGB")
+        if _is_blank_page(image):
+            return "No readable text found", "None"
+        key = _image_hash(image, max_side)
+        if seen is None:
+            return _extract_rgb_cached(image, max_side, key)
+
+        with seen_lock:
+            future = seen.get(key)
+            owner = future is None
+            if owner:
+                future = seen[key] = Future()
+        if not owner:
+            return future.result()
+        try:
+            result = _extract_rgb_cached(image, max_side, key)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        future.set_result(result)
+        return result
+
+
+def _ocr_pdf_pages(file_path: str, dpi: int, max_side=OCR_MAX_SIDE):
+    """Render a PDF at `dpi` and OCR its pages concurrently; returns [(text, engine)] in page order."""
+    # Render pages to disk and load them one at a time per worker,
+    # so peak memory is bounded by the pool size, not the page count
+    with tempfile.TemporaryDirectory(prefix="astramind_ocr_") as tmp_dir:
+        page_paths = convert_from_path(
+            file_path, dpi=dpi, output_folder=tmp_dir, paths_only=True,
+            thread_count=OCR_RENDER_THREADS,
+        )
+        # Pages are independent; Tesseract / Vision calls release the GIL
+        workers = min(len(page_paths), OCR_PARALLEL) or 1
+        seen, seen_lock = {}, threading.Lock()  # duplicate pages within this document
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            return list(ex.map(lambda p: _ocr_page_file(p, max_side, seen, seen_lock), page_paths))
+
+
+def _ocr_text_length(page_results) -> int:
+    return sum(len(t.strip()) for t, engine in page_results if engine != "None")
+
+
 def multi_stage_ocr(file_path: str, file_type: str):
     """
     Unified OCR pipeline for PDFs, DOCX, and Image files.
@@ -236,7 +562,7 @@ def multi_stage_ocr(file_path: str, file_type: str):
     4️⃣ Gemini Vision (fallback)
     """
 
-    timestamp = datetime.now().isoformat()
+    timestamp = now_iso()
     result = {
         "timestamp": timestamp,
         "text": "",
@@ -246,32 +572,27 @@ def multi_stage_ocr(file_path: str, file_type: str):
     }
 
     try:
-        text_chunks = []
-        tables = []
-
         # --- PDF Handling ---
         if file_type.lower() == "pdf":
             print("📄 Processing PDF...")
 
-            # Step 1: Extract text + tables using pdfplumber
-            tables = extract_tables_from_pdf(file_path)
+            # Step 1: Extract text + tables using pdfplumber (one pass over the pages)
+            text, tables, text_len = _extract_pdf_text_and_tables(file_path)
             result["tables"] = tables
 
-            with pdfplumber.open(file_path) as pdf:
-                for page in pdf.pages:
-                    text = page.extract_text(layout=True) or ""
-                    if text.strip():
-                        text_chunks.append(text)
-
             # Step 2: Fallback for scanned PDFs (no text layer)
-            if len("".join(text_chunks).strip()) < 20:
+            if text_len < 20:
                 print("⚠️ PDF appears to be scanned — using image-based OCR...")
-                pages = convert_from_path(file_path, dpi=200)
                 page_texts = []
                 used_engines = set()
 
-                for i, img in enumerate(pages, start=1):
-                    page_text, engine = extract_text_from_image(img)
+                page_results = _ocr_pdf_pages(file_path, OCR_DPI)
+                if _ocr_text_length(page_results) < 20 and OCR_RETRY_DPI > OCR_DPI:
+                    # Fast pass found (almost) nothing — small print; retry at full resolution
+                    print(f"⚠️ Little text at {OCR_DPI} dpi — retrying OCR at {OCR_RETRY_DPI} dpi...")
+                    page_results = _ocr_pdf_pages(file_path, OCR_RETRY_DPI, max_side=None)
+
+                for i, (page_text, engine) in enumerate(page_results, start=1):
                     page_texts.append(page_text)
                     used_engines.add(engine)
                     print(f"🧠 Page {i} processed via {engine}")
@@ -281,7 +602,7 @@ def multi_stage_ocr(file_path: str, file_type: str):
                 result["message"] = "✅ PDF processed via vision-based OCR pipeline"
                 return result
 
-            result["text"] = "\n".join(text_chunks).strip()
+            result["text"] = text
             result["engine"] = "pdfplumber"
             result["message"] = "✅ PDF processed successfully"
             return result
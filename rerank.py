@@ -1,13 +1,25 @@
 import os
-import re
 import json
+import hashlib
+import threading
 import traceback
+from collections import OrderedDict
 from typing import List, Dict, Any
 
 from dotenv import load_dotenv
 import google.generativeai as genai
+import numpy as np
 
-from services.llm import score_relevance
+from services.llm import get_model
+from services.bm25 import IncrementalBM25
+from services.tokenizer import _tokenize_text
+
+# --- orjson (optional, much faster than stdlib json) ---
+try:
+    import orjson
+    _ORJSON_ENABLED = True
+except Exception:
+    _ORJSON_ENABLED = False
 
 # Load environment
 load_dotenv()
@@ -15,6 +27,10 @@ load_dotenv()
 # ✅ Configure Gemini for semantic reranking
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
 USE_SEMANTIC_RERANKER = True if GEMINI_API_KEY else False
+RERANK_MODEL = "gemini-1.5-flash-latest"
+# Queries shorter than this are reranked lexically (a Gemini call costs ~1s)
+RERANK_MIN_QUERY_WORDS = int(os.getenv("RERANK_MIN_QUERY_WORDS", "3"))
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "1024"))  # memoized Gemini rerank calls
 
 if GEMINI_API_KEY:
     genai.configure(api_key=GEMINI_API_KEY)
@@ -27,13 +43,62 @@ else:
 # ✅ Helpers
 # ------------------------------------------------------------
 def _normalize_scores(scores: List[float]) -> List[float]:
-    """Normalize scores between 0 and 1."""
+    """Normalize scores between 0 and 1 (one vectorized pass, not per-item Python math)."""
     if not scores:
         return []
-    min_s, max_s = min(scores), max(scores)
+    arr = np.asarray(scores, dtype=np.float64)
+    min_s, max_s = arr.min(), arr.max()
     if max_s == min_s:
         return [1.0] * len(scores)
-    return [(s - min_s) / (max_s - min_s) for s in scores]
+    return ((arr - min_s) / (max_s - min_s)).tolist()
+
+
+_JSON_DECODER = json.JSONDecoder()
+
+
+def _extract_json_list(text: str):
+    """Single forward scan from the first '[' (no regex backtracking over the reply)."""
+    start = text.find("[")
+    if start < 0:
+        return []
+    if _ORJSON_ENABLED:
+        # Fast path: the reply is usually just the list (maybe inside a code fence)
+        end = text.rfind("]")
+        try:
+            return orjson.loads(text[start:end + 1])
+        except orjson.JSONDecodeError:
+            pass  # extra text after the list — let raw_decode stop at its end
+    parsed, _ = _JSON_DECODER.raw_decode(text, start)
+    return parsed
+
+
+_RERANK_CACHE = OrderedDict()  # (query, doc texts) fingerprint -> per-doc scores, LRU order
+_RERANK_CACHE_LOCK = threading.Lock()
+
+
+def _rerank_key(query: str, docs: List[Dict[str, Any]]) -> bytes:
+    h = hashlib.blake2b(digest_size=16)
+    h.update(query.encode("utf-8", "surrogatepass"))
+    for d in docs:
+        h.update(b"\x00")
+        h.update(d.get("text", "").encode("utf-8", "surrogatepass"))
+    return h.digest()
+
+
+def _rerank_cache_get(key: bytes):
+    with _RERANK_CACHE_LOCK:
+        scores = _RERANK_CACHE.get(key)
+        if scores is not None:
+            _RERANK_CACHE.move_to_end(key)
+        return scores
+
+
+def _rerank_cache_put(key: bytes, scores: List[float]):
+    with _RERANK_CACHE_LOCK:
+        _RERANK_CACHE[key] = scores
+        _RERANK_CACHE.move_to_end(key)
+        while len(_RERANK_CACHE) > RERANK_CACHE_SIZE:
+            _RERANK_CACHE.popitem(last=False)
 
 
 def _truncate(text: str, max_chars: int = 500) -> str:
@@ -46,15 +111,14 @@ def _truncate(text: str, max_chars: int = 500) -> str:
 # ------------------------------------------------------------
 def _lexical_rerank(query: str, docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """
-    Lightweight BM25-like reranker (fallback when Gemini fails or is disabled).
-    Uses LLM-based lexical scoring function for approximate relevance.
+    Lightweight BM25 reranker (fallback when Gemini fails or is disabled).
+    Scores the candidates as their own small corpus, in-process.
     """
     print("ℹ️ Using Lexical Reranker (fallback).")
-    reranked = []
-    for d in docs:
-        score = score_relevance(query, d.get("text", ""))
-        reranked.append({**d, "rerank_score": float(score)})
-    return reranked
+    model = IncrementalBM25()
+    model.add([_tokenize_text(d.get("text", "")) for d in docs])
+    scores = model.get_scores(_tokenize_text(query))
+    return [{**d, "rerank_score": float(s)} for d, s in zip(docs, scores)]
 
 
 # ------------------------------------------------------------
@@ -69,7 +133,16 @@ def _semantic_rerank(query: str, docs: List[Dict[str, Any]]) -> List[Dict[str, A
         if not docs:
             return []
 
-        model = genai.GenerativeModel("gemini-1.5-flash-latest")
+        # ⚡ Same query over the same candidate texts → reuse the last Gemini scores
+        cache_key = _rerank_key(query, docs)
+        cached = _rerank_cache_get(cache_key)
+        if cached is not None:
+            for d, score in zip(docs, cached):
+                d["rerank_score"] = score
+            print(f"⚡ Rerank cache hit ({len(docs)} docs).")
+            return docs
+
+        model = get_model(RERANK_MODEL)
 
         snippets = "\n".join(
             [f"{i+1}. {_truncate(d.get('text', ''))}" for i, d in enumerate(docs)]
@@ -94,12 +167,9 @@ Do NOT include any text or explanation outside JSON.
         response = model.generate_content(prompt)
         text = getattr(response, "text", "").strip()
 
-        # Extract only the JSON list from response
-        match = re.search(r"\[.*\]", text, re.DOTALL)
-        json_str = match.group(0) if match else "[]"
-
+        # Decode the first JSON list in the response; trailing prose / fences are ignored
         try:
-            parsed = json.loads(json_str)
+            parsed = _extract_json_list(text)
         except json.JSONDecodeError:
             print("⚠️ Gemini reranker returned malformed JSON — fallback to lexical rerank.")
             return _lexical_rerank(query, docs)
@@ -116,6 +186,8 @@ Do NOT include any text or explanation outside JSON.
             if "rerank_score" not in d:
                 d["rerank_score"] = 0.0
 
+        _rerank_cache_put(cache_key, [d["rerank_score"] for d in docs])
+
         print(f"✅ Semantic reranking completed ({len(docs)} docs).")
         return docs
 
@@ -139,8 +211,12 @@ def rerank_results(query: str, retrieved_chunks: List[Dict[str, Any]], top_n: in
         if not retrieved_chunks:
             return []
 
-        # Choose reranker
-        if USE_SEMANTIC_RERANKER:
+        # ⚡ A single candidate has nothing to reorder — skip the reranker call
+        if len(retrieved_chunks) == 1:
+            return [{**retrieved_chunks[0], "rerank_score": 1.0}][:top_n]
+
+        # Choose reranker (very short queries: lexical is sufficient)
+        if USE_SEMANTIC_RERANKER and len(query.split()) >= RERANK_MIN_QUERY_WORDS:
             reranked = _semantic_rerank(query, retrieved_chunks)
         else:
             reranked = _lexical_rerank(query, retrieved_chunks)
@@ -0,0 +1,138 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- FAISS (optional) ---
+try:
+    import faiss
+    _FAISS_ENABLED = True
+except Exception as e:
+    print("⚠️ FAISS not available — semantic cache disabled:", e)
+    _FAISS_ENABLED = False
+
+SEMCACHE_THRESHOLD = float(os.getenv("SEMCACHE_THRESHOLD", "0.92"))
+SEMCACHE_MAX_ENTRIES = int(os.getenv("SEMCACHE_MAX_ENTRIES", "10000"))
+SEMCACHE_TTL = int(os.getenv("SEMCACHE_TTL", "3600"))  # Default 1 hour
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", str(7 * 24 * 3600)))  # Default 7 days
+
+
+class SemanticCache:
+    """
+    🧠 Embedding-keyed response cache for AstraMind
+    ---------------------------------------
+    - Near-duplicate questions hit the same entry (cosine ≥ threshold)
+    - One FAISS inner-product index per context key, so identical wording
+      under a different conversation / search setting never collides
+    - Bounded LRU with per-entry TTL
+    """
+
+    def __init__(
+        self,
+        threshold: float = SEMCACHE_THRESHOLD,
+        max_entries: int = SEMCACHE_MAX_ENTRIES,
+        ttl: int = SEMCACHE_TTL,
+    ):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._indexes = {}               # context -> faiss.IndexIDMap2
+        self._entries = OrderedDict()    # id -> (context, payload, created_at), LRU order
+        self._next_id = 0
+
+    # ------------------------------------------------------------
+    # ✅ Helpers
+    # ------------------------------------------------------------
+    @staticmethod
+    def _as_unit_vector(embedding) -> np.ndarray:
+        """Copy to a (1, dim) float32 row and L2-normalize so IP == cosine."""
+        vec = np.array(embedding, dtype=np.float32).reshape(1, -1)
+        faiss.normalize_L2(vec)
+        return vec
+
+    def _remove(self, entry_id: int):
+        context, _, _ = self._entries.pop(entry_id)
+        index = self._indexes.get(context)
+        if index is None:
+            return
+        index.remove_ids(np.array([entry_id], dtype=np.int64))
+        if index.ntotal == 0:
+            del self._indexes[context]
+
+    # ------------------------------------------------------------
+    # ✅ Lookup / Insert
+    # ------------------------------------------------------------
+    def lookup(self, embedding, context: str = "") -> Optional[Any]:
+        """Return the cached payload for the nearest prior query, or None."""
+        if not _FAISS_ENABLED or embedding is None:
+            return None
+        try:
+            vec = self._as_unit_vector(embedding)
+            with self._lock:
+                index = self._indexes.get(context)
+                if index is None or index.ntotal == 0 or index.d != vec.shape[1]:
+                    return None
+
+                scores, ids = index.search(vec, 1)
+                score, entry_id = float(scores[0][0]), int(ids[0][0])
+                if entry_id < 0 or score < self.threshold:
+                    return None
+
+                _, payload, created_at = self._entries[entry_id]
+                if time.time() - created_at > self.ttl:
+                    self._remove(entry_id)
+                    return None
+
+                self._entries.move_to_end(entry_id)
+                print(f"⚡ Semantic cache hit (cosine={score:.3f})")
+                return payload
+        except Exception as e:
+            print(f"⚠️ Semantic cache lookup failed: {e}")
+            return None
+
+    def insert(self, embedding, payload: Any, context: str = ""):
+        """Store a payload under the query embedding."""
+        if not _FAISS_ENABLED or embedding is None:
+            return
+        try:
+            vec = self._as_unit_vector(embedding)
+            with self._lock:
+                index = self._indexes.get(context)
+                if index is None:
+                    index = faiss.IndexIDMap2(faiss.IndexFlatIP(vec.shape[1]))
+                    self._indexes[context] = index
+                elif index.d != vec.shape[1]:
+                    return
+
+                entry_id = self._next_id
+                self._next_id += 1
+                index.add_with_ids(vec, np.array([entry_id], dtype=np.int64))
+                self._entries[entry_id] = (context, payload, time.time())
+
+                while len(self._entries) > self.max_entries:
+                    self._remove(next(iter(self._entries)))
+        except Exception as e:
+            print(f"⚠️ Semantic cache insert failed: {e}")
+
+    def clear(self):
+        """Drop every entry (call whenever the indexed corpus changes)."""
+        with self._lock:
+            self._indexes.clear()
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# ------------------------------------------------------------
+# ✅ Global Instance
+# ------------------------------------------------------------
+answer_cache = SemanticCache()
+search_cache = SemanticCache(ttl=SEARCH_CACHE_TTL)  # hybrid_search results
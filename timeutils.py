@@ -0,0 +1,19 @@
+import time
+from datetime import datetime
+
+# (epoch second, formatted string) — replaced atomically, safe across threads
+_ts_cache = (0, "")
+
+
+def now_iso() -> str:
+    """
+    Current local time as ISO-8601 at second precision.
+    Formatted at most once per wall-clock second and shared by all callers.
+    """
+    global _ts_cache
+    sec = int(time.time())
+    cached_sec, text = _ts_cache
+    if cached_sec != sec:
+        text = datetime.fromtimestamp(sec).isoformat()
+        _ts_cache = (sec, text)
+    return text
@@ -0,0 +1,14 @@
+from typing import List
+
+# Import-side-effect-free on purpose: spawned BM25 tokenizer workers import
+# only this module, never the index in services.bm25.
+
+# Alphanumeric runs after lowercasing == the old "strip symbols, lower, split".
+# Byte table maps everything except [a-z0-9] to a space; non-ASCII is encoded
+# as "?" first, so it separates tokens exactly like the [a-z0-9]+ regex did
+_TOKEN_TABLE = bytes(c if (48 <= c <= 57 or 97 <= c <= 122) else 32 for c in range(256))
+
+
+def _tokenize_text(text: str) -> List[str]:
+    """Module-level tokenizer so it can be shipped to worker processes."""
+    return text.lower().encode("ascii", "replace").translate(_TOKEN_TABLE).decode("ascii").split()
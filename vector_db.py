@@ -1,8 +1,14 @@
 import os
+import asyncio
+import sqlite3
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from pinecone import Pinecone, ServerlessSpec
+from pinecone import ServerlessSpec
 from typing import List, Dict, Any, Union
-from services.embeddings import embed_text
+from services.embeddings import embed_batch
+from services import metrics
 
 # ============================================================
 # ✅ Load environment variables
@@ -12,6 +18,26 @@ PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "astramind-hybrid-index")
 PINECONE_REGION = os.getenv("PINECONE_REGION", "us-east-1")
 
+# Pinecone accepts at most 100 vectors per upsert request
+PINECONE_UPSERT_BATCH = 100
+# Pinecone accepts at most 1000 IDs per delete request
+PINECONE_DELETE_BATCH = 1000
+PINECONE_DELETE_CONCURRENCY = int(os.getenv("PINECONE_DELETE_CONCURRENCY", "8"))
+PINECONE_MAX_RETRIES = 3  # retries on HTTP 429 (rate limited)
+PINECONE_STATS_TTL = float(os.getenv("PINECONE_STATS_TTL", "10"))  # seconds describe_index_stats() is reused
+# Upsert requests kept in flight at once
+PINECONE_UPSERT_CONCURRENCY = int(os.getenv("PINECONE_UPSERT_CONCURRENCY", "8"))
+# Local source -> vector ID index, so delete_source() needs no list() round trips
+SOURCE_INDEX_PATH = os.getenv("PINECONE_SOURCE_INDEX", "sources.db")
+
+# --- gRPC data plane (optional: pip install "pinecone-client[grpc]") ---
+try:
+    from pinecone.grpc import PineconeGRPC as Pinecone
+    _PINECONE_GRPC = True
+except Exception:
+    from pinecone import Pinecone
+    _PINECONE_GRPC = False
+
 if not PINECONE_API_KEY:
     raise ValueError("❌ Missing PINECONE_API_KEY in .env")
 
@@ -30,11 +56,75 @@ try:
             metric="cosine",
             spec=ServerlessSpec(cloud="aws", region=PINECONE_REGION)
         )
-    index = pc.Index(PINECONE_INDEX_NAME)
+    if _PINECONE_GRPC:
+        index = pc.Index(PINECONE_INDEX_NAME)
+        print("⚡ Pinecone gRPC client enabled")
+    else:
+        index = pc.Index(PINECONE_INDEX_NAME, pool_threads=PINECONE_UPSERT_CONCURRENCY)
 except Exception as e:
     raise RuntimeError(f"❌ Failed to connect or create Pinecone index: {e}")
 
 
+# ============================================================
+# ✅ Source -> ID sidecar (SQLite)
+# ============================================================
+_SOURCE_IDS_LOCK = threading.Lock()
+try:
+    _source_ids = sqlite3.connect(SOURCE_INDEX_PATH, isolation_level=None, check_same_thread=False)
+    _source_ids.execute("PRAGMA journal_mode=WAL")
+    _source_ids.execute(
+        "CREATE TABLE IF NOT EXISTS source_ids ("
+        "namespace TEXT, source TEXT, vector_id TEXT, "
+        "PRIMARY KEY (namespace, source, vector_id))"
+    )
+except Exception as e:
+    print("⚠️ Source ID index unavailable — deletes will list IDs from Pinecone:", e)
+    _source_ids = None
+
+
+def _record_source_ids(vectors: List[Dict[str, Any]], namespace: str):
+    """Remember which source each upserted vector ID belongs to."""
+    if _source_ids is None or not vectors:
+        return
+    rows = [(namespace, v["metadata"].get("source", ""), v["id"]) for v in vectors]
+    try:
+        with _SOURCE_IDS_LOCK:
+            _source_ids.executemany("INSERT OR IGNORE INTO source_ids VALUES (?, ?, ?)", rows)
+    except Exception as e:
+        print("⚠️ Failed to record source IDs:", e)
+
+
+def _lookup_source_ids(source: str, namespace: str) -> List[str]:
+    if _source_ids is None:
+        return []
+    try:
+        with _SOURCE_IDS_LOCK:
+            rows = _source_ids.execute(
+                "SELECT vector_id FROM source_ids WHERE namespace = ? AND source = ?",
+                (namespace, source),
+            ).fetchall()
+        return [r[0] for r in rows]
+    except Exception as e:
+        print("⚠️ Source ID lookup failed:", e)
+        return []
+
+
+def _forget_source_ids(namespace: str, source: str = None):
+    """Drop sidecar rows for one source, or the whole namespace if source is None."""
+    if _source_ids is None:
+        return
+    try:
+        with _SOURCE_IDS_LOCK:
+            if source is None:
+                _source_ids.execute("DELETE FROM source_ids WHERE namespace = ?", (namespace,))
+            else:
+                _source_ids.execute(
+                    "DELETE FROM source_ids WHERE namespace = ? AND source = ?", (namespace, source)
+                )
+    except Exception as e:
+        print("⚠️ Failed to update source ID index:", e)
+
+
 # ============================================================
 # ✅ Helper — Flatten Table Structures for OCR Tables
 # ============================================================
@@ -55,10 +145,13 @@ def upsert_vectors(
     namespace: str = "default",
     source: str = "uploaded_file",
     meta_extra: Dict[str, Any] = None,
+    pending: List[Dict[str, Any]] = None,
 ):
     """
     Upserts text, OCR, or table chunks into Pinecone with metadata.
     Embeddings are generated via Gemini/Text Embedding model.
+    If `pending` is given, vectors are appended to it instead of being sent;
+    call flush_vectors(pending) once the whole batch is collected.
     """
     if not chunks:
         print("⚠️ No chunks to upsert.")
@@ -67,30 +160,34 @@ def upsert_vectors(
     formatted = []
     success, errors = 0, 0
 
-    for i, chunk in enumerate(chunks):
+    # ✅ Embed every chunk up front in batched API calls
+    texts = [(chunk or "").strip() for chunk in chunks]
+    embeddings = embed_batch(texts)
+
+    # ✅ Per-document metadata, sanitized once (Pinecone doesn’t allow None or null metadata)
+    extra = meta_extra or {}
+    base_meta = {
+        "source": str(source or "unknown"),
+        "type": str(extra.get("type", "text")),
+        "engine": str(extra.get("engine", "Hybrid OCR")),
+        "page": str(extra.get("page", "unknown")),
+    }
+    for k, v in base_meta.items():
+        if v == "None":
+            base_meta[k] = "unknown"
+
+    for i, chunk in enumerate(texts):
         try:
-            chunk = (chunk or "").strip()
             if not chunk:
                 continue
 
-            emb = embed_text(chunk)
+            emb = embeddings[i]
             if not emb:
                 raise ValueError("Empty embedding returned")
 
-            # ✅ Sanitize metadata to avoid null errors
-            metadata = {
-                "text": chunk,
-                "source": str(source or "unknown"),
-                "chunk_index": i,
-                "type": str(meta_extra.get("type", "text")) if meta_extra else "text",
-                "engine": str(meta_extra.get("engine", "Hybrid OCR")) if meta_extra else "Hybrid OCR",
-                "page": str(meta_extra.get("page", "unknown")) if meta_extra else "unknown",
-            }
-
-            # Pinecone doesn’t allow None or null metadata
-            for k, v in metadata.items():
-                if v is None or v == "None":
-                    metadata[k] = "unknown"
+            metadata = base_meta.copy()
+            metadata["text"] = chunk
+            metadata["chunk_index"] = i
 
             formatted.append({
                 "id": f"{source}_chunk_{i}",
@@ -103,13 +200,13 @@ def upsert_vectors(
             errors += 1
             print(f"⚠️ Skipped chunk {i}: {e}")
 
-    # ✅ Bulk upload to Pinecone
+    # ✅ Bulk upload to Pinecone (or defer to the caller's batch)
     if formatted:
-        try:
-            index.upsert(vectors=formatted, namespace=namespace)
-            print(f"✅ Upserted {success}/{len(chunks)} chunks to namespace '{namespace}'")
-        except Exception as e:
-            print(f"❌ Pinecone upsert failed: {e}")
+        if pending is not None:
+            pending.extend(formatted)
+            print(f"📦 Queued {success}/{len(chunks)} chunks from '{source}' for batch upsert")
+        else:
+            flush_vectors(formatted, namespace=namespace)
     else:
         print("⚠️ No valid chunks to insert after preprocessing.")
 
@@ -117,6 +214,39 @@ def upsert_vectors(
         print(f"⚠️ {errors} chunks failed embedding or upload.")
 
 
+def flush_vectors(
+    vectors: List[Dict[str, Any]],
+    namespace: str = "default",
+    batch_size: int = PINECONE_UPSERT_BATCH,
+):
+    """
+    Upserts prepared vectors in groups of `batch_size` (one request per group).
+    Groups are sent with async_req=True, up to PINECONE_UPSERT_CONCURRENCY
+    requests in flight, instead of waiting on each round trip in turn.
+    """
+    groups = [vectors[s:s + batch_size] for s in range(0, len(vectors), batch_size)]
+    sent = 0
+    for w in range(0, len(groups), PINECONE_UPSERT_CONCURRENCY):
+        window = groups[w:w + PINECONE_UPSERT_CONCURRENCY]
+        in_flight = []
+        for group in window:
+            try:
+                in_flight.append((group, index.upsert(vectors=group, namespace=namespace, async_req=True)))
+            except Exception as e:
+                print(f"❌ Pinecone upsert failed: {e}")
+        for group, req in in_flight:
+            try:
+                # gRPC returns a Future, the REST client a thread-pool ApplyResult
+                req.result() if hasattr(req, "result") else req.get()
+                sent += len(group)
+                _record_source_ids(group, namespace)
+            except Exception as e:
+                print(f"❌ Pinecone upsert failed: {e}")
+    if vectors:
+        _invalidate_stats()
+        print(f"✅ Upserted {sent}/{len(vectors)} vectors to namespace '{namespace}'")
+
+
 # ============================================================
 # ✅ Vector Search (Semantic Retrieval)
 # ============================================================
@@ -165,52 +295,167 @@ def reset_namespace(namespace: str = "default"):
     """
     try:
         index.delete(delete_all=True, namespace=namespace)
+        _invalidate_stats()
+        _forget_source_ids(namespace)
         print(f"♻️ Namespace '{namespace}' cleared successfully.")
     except Exception as e:
         print("❌ Failed to clear namespace:", e)
 
 
+# ============================================================
+# ✅ Rate-limit backoff
+# ============================================================
+def _is_rate_limited(e: Exception) -> bool:
+    status = getattr(e, "status", None) or getattr(e, "status_code", None)
+    return status == 429 or "429" in str(e) or "Too Many Requests" in str(e)
+
+
+def _with_backoff(fn, *args, **kwargs):
+    """Call fn, retrying with exponential backoff (0.5s, 1s, 2s) when Pinecone returns 429."""
+    for attempt in range(PINECONE_MAX_RETRIES + 1):
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if attempt == PINECONE_MAX_RETRIES or not _is_rate_limited(e):
+                raise
+            time.sleep(0.5 * 2 ** attempt)
+
+
 # ============================================================
 # ✅ Delete Source (remove all chunks from a document)
 # ============================================================
 def delete_source(source: str, namespace: str = "default"):
     """
     Deletes all vector chunks belonging to a specific source document.
+    IDs come from the local source index when it knows the source; otherwise
+    (serverless) page through IDs by the `{source}_chunk_` prefix upsert_vectors()
+    assigns. Pod indexes: one server-side metadata-filter delete.
     """
+    with metrics.delete_timer(namespace):
+        status, deleted, failed = _delete_source(source, namespace)
+    metrics.record_delete(namespace, status, deleted, failed)
+
+
+def _delete_source(source: str, namespace: str):
+    """Body of delete_source(); returns (status, deleted IDs, failed IDs) for metrics."""
     try:
-        response = index.query(
-            vector=[0.0] * 768,
-            top_k=1000,
-            include_metadata=True,
-            namespace=namespace
-        )
+        deleted = 0
+        try:
+            # list() yields ID pages of ~100; full 1000-ID delete requests go out
+            # concurrently while listing continues
+            def _delete(ids):
+                try:
+                    _with_backoff(index.delete, ids=ids, namespace=namespace)
+                    return len(ids), None
+                except Exception as e:
+                    return 0, (len(ids), e)
 
-        ids_to_delete = [
-            m.id for m in response.matches
-            if m.metadata and m.metadata.get("source") == source
-        ]
+            known = _lookup_source_ids(source, namespace)
+            pages = [known] if known else index.list(prefix=f"{source}_chunk_", namespace=namespace)
 
-        if ids_to_delete:
-            index.delete(ids=ids_to_delete, namespace=namespace)
-            print(f"🗑️ Deleted {len(ids_to_delete)} vectors for source: {source}")
+            futures, batch = [], []
+            with ThreadPoolExecutor(max_workers=PINECONE_DELETE_CONCURRENCY) as ex:
+                for ids in pages:
+                    batch.extend(ids or [])
+                    while len(batch) >= PINECONE_DELETE_BATCH:
+                        futures.append(ex.submit(_delete, batch[:PINECONE_DELETE_BATCH]))
+                        batch = batch[PINECONE_DELETE_BATCH:]
+                if batch:
+                    futures.append(ex.submit(_delete, batch))
+                errors = []
+                for f in futures:
+                    ok, err = f.result()
+                    deleted += ok
+                    if err:
+                        errors.append(err)
+        except Exception:
+            # ID listing unavailable (pod index) — server-side metadata-filter delete
+            _with_backoff(index.delete, filter={"source": {"$eq": source}}, namespace=namespace)
+            _invalidate_stats()
+            _forget_source_ids(namespace, source)
+            print(f"🗑️ Deleted vectors for source: {source} (filter)")
+            return "filter", 0, 0
+
+        failed = sum(n for n, _ in errors)
+        if not failed:
+            _forget_source_ids(namespace, source)
+        if deleted:
+            _invalidate_stats()
+        if errors:
+            print(f"❌ Deleted {deleted} vectors for source '{source}'; {failed} failed: {errors[0][1]}")
+        elif deleted:
+            print(f"🗑️ Deleted {deleted} vectors for source: {source}")
         else:
             print(f"⚠️ No vectors found for source '{source}'")
+        status = "err" if failed else ("ok" if deleted else "empty")
+        return status, deleted, failed
     except Exception as e:
         print("❌ Error deleting vectors for source:", e)
+        return "err", 0, 0
 
 
 # ============================================================
 # ✅ Get Namespace Summary
 # ============================================================
-def describe_namespace(namespace: str = "default"):
+_STATS_CACHE = {"at": 0.0, "stats": None}
+_STATS_LOCK = threading.Lock()
+
+
+def _invalidate_stats():
+    """Forget cached index stats (call after any write to the index)."""
+    with _STATS_LOCK:
+        _STATS_CACHE["stats"] = None
+
+
+def _index_stats(fresh: bool = False):
+    """describe_index_stats() (all namespaces), reused for PINECONE_STATS_TTL seconds."""
+    with _STATS_LOCK:
+        stats, at = _STATS_CACHE["stats"], _STATS_CACHE["at"]
+        if not fresh and stats is not None and time.monotonic() - at < PINECONE_STATS_TTL:
+            return stats
+    stats = index.describe_index_stats()
+    with _STATS_LOCK:
+        _STATS_CACHE["stats"], _STATS_CACHE["at"] = stats, time.monotonic()
+    return stats
+
+
+def describe_namespace(namespace: str = "default", fresh: bool = False):
     """
     Retrieves index statistics for the given namespace.
+    Stats are cached briefly; pass fresh=True to force a new control-plane call.
     """
     try:
-        stats = index.describe_index_stats()
+        stats = _index_stats(fresh=fresh)
         ns_data = stats.get("namespaces", {}).get(namespace, {})
-        print(f"📊 Namespace '{namespace}' stats:", ns_data)
+        metrics.record_stats_call(namespace, "ok")
         return ns_data
     except Exception as e:
+        metrics.record_stats_call(namespace, "err")
         print("❌ Failed to retrieve namespace stats:", e)
         return {}
+
+
+# ============================================================
+# ✅ Async wrappers (admin endpoints)
+# ============================================================
+async def adelete_source(source: str, namespace: str = "default"):
+    """delete_source() on a worker thread so the event loop stays free."""
+    await asyncio.to_thread(delete_source, source, namespace)
+
+
+async def adescribe_namespace(namespace: str = "default", fresh: bool = False):
+    return await asyncio.to_thread(describe_namespace, namespace, fresh)
+
+
+async def adelete_and_summarize(source: str, namespace: str = "default"):
+    """
+    Delete a source and fetch fresh namespace stats concurrently — one RTT
+    instead of two. Pinecone stats are eventually consistent either way, so
+    the counts may not yet reflect this delete.
+    """
+    _, stats = await asyncio.gather(
+        adelete_source(source, namespace),
+        adescribe_namespace(namespace, fresh=True),
+    )
+    _invalidate_stats()  # the overlapped read may predate the delete; don't serve it from cache
+    return stats